@@ -2,12 +2,12 @@ from uuid import uuid4
 
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from django_resized import ResizedImageField
 from phonenumber_field.modelfields import PhoneNumberField
 from django.utils import timezone
 from django.conf import settings
 
 from account.managers import UserManager
+from utils.images import DeferredResizedImageField, IMAGE_STATUS, IMAGE_READY
 from utils.models import TimeStampAbstractModel
 
 
@@ -19,9 +19,13 @@ class User(AbstractUser, TimeStampAbstractModel):
         ordering = ('-date_joined',)
 
     username = None
-    avatar = ResizedImageField(size=[500, 500], crop=['middle', 'center'], upload_to='avatars/',
-                               force_format='WEBP', quality=90, verbose_name='аватарка',
-                               null=True, blank=True)
+    avatar = DeferredResizedImageField(size=[500, 500], crop=['middle', 'center'], upload_to='avatars/',
+                                       force_format='WEBP', quality=90, verbose_name='аватарка',
+                                       null=True, blank=True, status_field='avatar_status',
+                                       variants_field='avatar_variants')
+    avatar_status = models.CharField('статус аватарки', choices=IMAGE_STATUS, default=IMAGE_READY, max_length=20,
+                                     editable=False)
+    avatar_variants = models.JSONField('варианты аватарки', default=dict, blank=True, editable=False)
     phone = PhoneNumberField(max_length=100, unique=True, verbose_name='номер телефона', blank=True, null=True)
     email = models.EmailField(verbose_name='электронная почта', unique=True)
 
@@ -0,0 +1,62 @@
+"""
+Setup shared by the benchmark scripts: Django with the project settings on a
+throwaway test database, created and dropped like `manage.py test` does, so a
+benchmark never touches real data. SQLite test databases are put in a temporary
+file instead of memory, so locking behaves as in production.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+
+@contextmanager
+def benchmark_database():
+    import django
+    django.setup()
+
+    from django.db import connections
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases, \
+        teardown_test_environment
+
+    with tempfile.TemporaryDirectory() as directory:
+        for connection in connections.all():
+            if connection.vendor == 'sqlite' and not connection.settings_dict['TEST'].get('MIRROR'):
+                connection.settings_dict['TEST']['NAME'] = os.path.join(directory, f'{connection.alias}.sqlite3')
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+
+def measure(func, repeat=5, number=1):
+    """Median seconds of one call of `func` over `repeat` rounds of `number` calls."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number)
+    return statistics.median(timings)
+
+
+def get(client, url, status=200):
+    """GETs `url` through the full stack with empty caches."""
+    from django.core.cache import caches
+    for cache in caches.all():
+        cache.clear()
+    response = client.get(url)
+    if response.status_code != status:
+        raise RuntimeError(f'GET {url}: {response.status_code} {response.content[:200]!r}')
+    return response
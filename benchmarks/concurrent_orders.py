@@ -0,0 +1,81 @@
+"""
+Throughput of concurrent order creation through /api/v1/orders/ on SQLite, with
+the stock settings and with SQLITE_TUNING. Each mode runs in its own process,
+because the settings are read once at import.
+
+    python benchmarks/concurrent_orders.py --threads 8 --orders 50
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from common import benchmark_database
+
+
+def run(threads, orders):
+    from django.db import connections
+    from django.test import Client
+    from core.models import Category, Food, Order, Size
+
+    category = Category.objects.create(name='Бенчмарк')
+    foods = [Food.objects.create(name=f'Блюдо {index}', description='Описание', category=category,
+                                 image='food_images/food.webp') for index in range(3)]
+    sizes = [Size.objects.create(name='S', price='10.50', food=food) for food in foods]
+    payload = {
+        'name': 'Клиент', 'email': 'client@example.com', 'phone': '+996555123456', 'address': 'ул. Киевская',
+        'home': '1',
+        'ordering_food': [
+            {'food': food.pk, 'sizes_for_sale': [{'size': size.pk, 'quantity': 2}]} for food, size in zip(foods, sizes)
+        ],
+    }
+    statuses = []
+    connections.close_all()
+
+    def worker():
+        client = Client(raise_request_exception=False)
+        try:
+            for _ in range(orders):
+                statuses.append(client.post('/api/v1/orders/', payload, content_type='application/json').status_code)
+        finally:
+            connections.close_all()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    created = statuses.count(201)
+    assert Order.objects.count() == created
+    print(f'{connections["default"].settings_dict["ENGINE"]}: {created / seconds:.0f} orders/s, '
+          f'{created} of {len(statuses)} created, {len(statuses) - created} failed, {seconds:.2f} s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--orders', type=int, default=50, help='orders per thread')
+    parser.add_argument('--tuning', choices=('false', 'true'), help='run one mode in this process')
+    args = parser.parse_args()
+
+    if args.tuning is None:
+        for tuning in ('false', 'true'):
+            print(f'SQLITE_TUNING={tuning}: ', end='', flush=True)
+            subprocess.run([sys.executable, __file__, '--threads', str(args.threads), '--orders', str(args.orders),
+                            '--tuning', tuning], env={**os.environ, 'SQLITE_TUNING': tuning}, check=True)
+        return
+
+    with benchmark_database():
+        from django.db import connection
+        if connection.vendor != 'sqlite':
+            sys.exit('This benchmark is for SQLite, set DB_ENGINE=django.db.backends.sqlite3')
+        run(args.threads, args.orders)
+
+
+if __name__ == '__main__':
+    main()
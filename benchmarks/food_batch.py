@@ -0,0 +1,70 @@
+"""
+Time and query count of creating and then updating a batch of nested food
+payloads through /api/v1/food/batch/.
+
+    python benchmarks/food_batch.py --foods 1000
+"""
+import argparse
+import time
+
+from common import benchmark_database
+
+
+def make_payload(count, category_id, prefix='Блюдо'):
+    return [
+        {
+            'name': f'{prefix} {index}', 'description': 'Описание', 'category': category_id,
+            'makeups': [{'name': 'сыр'}, {'name': 'томаты'}],
+            'sizes': [{'name': 'S', 'price': '10.50'}, {'name': 'L', 'price': '20.00'}],
+            'weight': [{'value': '0.300'}],
+        }
+        for index in range(count)
+    ]
+
+
+def post_batch(client, data, label):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = client.post('/api/v1/food/batch/', data, content_type='application/json')
+        seconds = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f'{label}: {response.status_code} {response.content[:200]!r}')
+    print(f'{label} of {len(data)} foods: {seconds:.2f} s ({seconds / len(data) * 1000:.2f} ms per food), '
+          f'{len(queries)} queries')
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--foods', type=int, default=1000)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        from django.test import Client
+        from account.models import User
+        from core.models import Category
+
+        category = Category.objects.create(name='Бенчмарк')
+        client = Client()
+        client.force_login(User.objects.create_superuser(email='bench@example.com', password='bench'))
+
+        response = post_batch(client, make_payload(args.foods, category.pk), 'batch create')
+
+        # Rename every food, change one size price and drop a makeup; the weight stays as is.
+        updates = []
+        for food in response.json():
+            sizes = sorted(food['sizes'], key=lambda size: size['name'])
+            updates.append({
+                'id': food['id'], 'name': f'{food["name"]}*',
+                'makeups': [{'id': makeup['id'], 'name': makeup['name']} for makeup in food['makeups'][:1]],
+                'sizes': [{'id': sizes[0]['id'], 'name': 'L', 'price': '21.00'},
+                          {'id': sizes[1]['id'], 'name': 'S', 'price': '10.50'}],
+            })
+        post_batch(client, updates, 'batch update')
+
+
+if __name__ == '__main__':
+    main()
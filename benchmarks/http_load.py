@@ -0,0 +1,134 @@
+"""
+Keep-alive HTTP load generator for comparing the WSGI and ASGI deployments of
+the catalog endpoints under many concurrent connections. Standard library only,
+so it runs from any machine that can reach the servers.
+
+Start both servers against the same database, e.g.
+
+    gunicorn project.wsgi -w 4 -b 127.0.0.1:8001
+    uvicorn project.asgi:application --workers 4 --port 8002
+
+and run
+
+    python benchmarks/http_load.py wsgi=http://127.0.0.1:8001/api/v1/food/ \
+        asgi=http://127.0.0.1:8002/api/v1/food/ --connections 500 --duration 30
+
+Each target is loaded on its own, one after another, with the same settings.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+def parse_target(value):
+    name, sep, url = value.partition('=')
+    if not sep:
+        name, url = value, value
+    parts = urlsplit(url)
+    if parts.scheme != 'http' or not parts.hostname:
+        raise argparse.ArgumentTypeError(f'Only http:// URLs are supported: {url}')
+    path = parts.path or '/'
+    if parts.query:
+        path = f'{path}?{parts.query}'
+    return name, parts.hostname, parts.port or 80, path
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed')
+    status = int(status_line.split()[1])
+    length, chunked, close = None, False, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+        elif name == 'connection' and value == 'close':
+            close = True
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        close = True
+    return status, close
+
+
+async def connection_worker(host, port, path, deadline, stats):
+    request = f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: application/json\r\n\r\n'.encode()
+    writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, close = await read_response(reader)
+            stats['latencies'].append(time.perf_counter() - started)
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            stats['errors'] += 1
+            close = True
+            await asyncio.sleep(0.05)
+        if close and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_target(host, port, path, connections, duration):
+    stats = {'latencies': [], 'statuses': {}, 'errors': 0}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        connection_worker(host, port, path, started + duration, stats) for _ in range(connections)
+    ))
+    stats['elapsed'] = time.perf_counter() - started
+    return stats
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def report(name, stats):
+    latencies = sorted(stats['latencies'])
+    statuses = ', '.join(f'{status}: {count}' for status, count in sorted(stats['statuses'].items()))
+    mean = statistics.fmean(latencies) if latencies else float('nan')
+    print(f'{name}: {len(latencies) / stats["elapsed"]:.0f} req/s, {len(latencies)} responses ({statuses}), '
+          f'{stats["errors"]} errors')
+    print(f'    latency ms: mean {mean * 1000:.1f}, p50 {percentile(latencies, .5) * 1000:.1f}, '
+          f'p95 {percentile(latencies, .95) * 1000:.1f}, p99 {percentile(latencies, .99) * 1000:.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('targets', nargs='+', type=parse_target, metavar='[NAME=]URL')
+    parser.add_argument('--connections', '-c', type=int, default=500)
+    parser.add_argument('--duration', '-d', type=float, default=30, help='seconds per target')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds of untimed load per target')
+    args = parser.parse_args()
+
+    for name, host, port, path in args.targets:
+        if args.warmup:
+            asyncio.run(run_target(host, port, path, min(args.connections, 50), args.warmup))
+        report(name, asyncio.run(run_target(host, port, path, args.connections, args.duration)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Microbenchmark of DRF's JSONRenderer/JSONParser against ORJSONRenderer/ORJSONParser
+on real menu and order list responses.
+
+    python benchmarks/json_rendering.py --foods 500 --orders 2000
+"""
+import argparse
+import io
+from decimal import Decimal
+
+from common import benchmark_database, measure
+
+
+def create_data(foods, orders):
+    from core.models import Category, Food, FoodMakeup, FoodWeight, Order, OrderingFood, Size, SizeForSale
+
+    categories = Category.objects.bulk_create([Category(name=f'Категория {index}') for index in range(10)])
+    foods = Food.objects.bulk_create([
+        Food(name=f'Блюдо {index}', description='Описание «с кавычками»', category=categories[index % 10],
+             image='food_images/food.webp')
+        for index in range(foods)
+    ])
+    sizes = Size.objects.bulk_create([
+        Size(name=name, price=price, food=food) for food in foods for name, price in (('S', '10.50'), ('L', '20'))
+    ])
+    FoodMakeup.objects.bulk_create([FoodMakeup(name='сыр', food=food) for food in foods])
+    FoodWeight.objects.bulk_create([FoodWeight(value=Decimal('0.300'), food=food) for food in foods])
+    orders = Order.objects.bulk_create([
+        Order(name=f'Клиент {index}', email='client@example.com', phone='+996555123456', address='ул. Киевская',
+              home='1')
+        for index in range(orders)
+    ])
+    lines = OrderingFood.objects.bulk_create([
+        OrderingFood(order=order, food=foods[(order.pk + step) % len(foods)]) for order in orders for step in range(3)
+    ])
+    SizeForSale.objects.bulk_create([
+        SizeForSale(size=sizes[(line.food_id - foods[0].pk) * 2], quantity=2, ordering_food=line) for line in lines
+    ])
+
+
+def serialize(view_class, serializer_class):
+    from rest_framework.test import APIRequestFactory
+    from utils.querysets import optimize_queryset
+
+    request = APIRequestFactory().get('/')
+    queryset = optimize_queryset(view_class.queryset.all(), serializer_class(many=True))
+    return serializer_class(queryset, many=True, context={'request': request}).data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--foods', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        from rest_framework.parsers import JSONParser
+        from rest_framework.renderers import JSONRenderer
+        from core.parsers import ORJSONParser
+        from core.renderers import ORJSONRenderer, orjson
+        from core.serializers import OrderSerializer, ReadFoodSerializer
+        from core.views import FoodViewSet, OrderViewSet
+
+        if orjson is None:
+            print('orjson is not installed, ORJSONRenderer falls back to the stdlib renderer')
+        create_data(args.foods, args.orders)
+        payloads = {
+            f'menu, {args.foods} foods': serialize(FoodViewSet, ReadFoodSerializer),
+            f'orders, {args.orders} orders': serialize(OrderViewSet, OrderSerializer),
+        }
+
+        for name, data in payloads.items():
+            stdlib = JSONRenderer().render(data)
+            fast = ORJSONRenderer().render(data)
+            assert JSONParser().parse(io.BytesIO(stdlib)) == ORJSONParser().parse(io.BytesIO(fast)), name
+
+            print(f'{name} ({len(fast) / 1024:.0f} KiB):')
+            for label, func in (
+                ('render, JSONRenderer', lambda: JSONRenderer().render(data)),
+                ('render, ORJSONRenderer', lambda: ORJSONRenderer().render(data)),
+                ('parse, JSONParser', lambda: JSONParser().parse(io.BytesIO(stdlib))),
+                ('parse, ORJSONParser', lambda: ORJSONParser().parse(io.BytesIO(fast))),
+            ):
+                print(f'    {label:>24}: {measure(func, repeat=args.repeat) * 1000:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
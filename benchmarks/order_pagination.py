@@ -0,0 +1,74 @@
+"""
+Latency of the first and a deep page of the order list with page number and
+cursor pagination.
+
+    python benchmarks/order_pagination.py --page 10000 --page-size 10
+"""
+import argparse
+import itertools
+from datetime import timedelta
+from unittest import mock
+
+from common import benchmark_database, get, measure
+
+
+def create_orders(count):
+    from django.utils import timezone
+    from core.models import Order
+
+    # Distinct created_at values, as real orders have; bulk_create takes them from timezone.now().
+    start = timezone.now()
+    clock = (start - timedelta(milliseconds=step) for step in itertools.count())
+    with mock.patch('django.utils.timezone.now', lambda: next(clock)):
+        Order.objects.bulk_create((
+            Order(name=f'Клиент {index}', email='client@example.com', phone='+996555123456',
+                  address='ул. Киевская', home=str(index))
+            for index in range(count)
+        ), batch_size=2000)
+
+
+def get_cursor_url(base_url, offset):
+    """URL of the cursor page that starts after the `offset`-th order, as following `next` would give."""
+    from rest_framework.pagination import Cursor
+    from core.models import Order
+    from core.paginations import CreatedAtCursorPagination
+
+    paginator = CreatedAtCursorPagination()
+    paginator.base_url = base_url
+    previous = Order.objects.order_by(*paginator.ordering)[offset - 1]
+    return paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(previous.created_at)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--page', type=int, default=10000)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        from django.test import Client
+
+        create_orders(args.page * args.page_size)
+        client = Client()
+        pages = f'/api/v1/orders/?page_size={args.page_size}'
+        cursors = f'http://testserver/api/v1/orders/?pagination=cursor&page_size={args.page_size}'
+        urls = {
+            'page number, page 1': f'{pages}&page=1',
+            f'page number, page {args.page}': f'{pages}&page={args.page}',
+            'cursor, page 1': cursors,
+            f'cursor, page {args.page}': get_cursor_url(cursors, (args.page - 1) * args.page_size),
+        }
+        deep_pages = [
+            [order['id'] for order in get(client, url).json()['results']] for url in list(urls.values())[1::2]
+        ]
+        assert deep_pages[0] == deep_pages[1] and len(deep_pages[0]) == args.page_size, 'Modes return other pages'
+
+        print(f'{args.page * args.page_size} orders, {args.page_size} per page')
+        for name, url in urls.items():
+            seconds = measure(lambda: get(client, url), repeat=args.repeat)
+            print(f'{name:>28}: {seconds * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,13 @@ from django.contrib import admin
 from django.contrib.admin import options
 from django import forms
 
+from nested_admin.formsets import NestedInlineFormSet
 from nested_admin.nested import NestedTabularInline, NestedModelAdmin
 
-from .models import Category, Food, FoodMakeup, Size, FoodWeight, OrderingFood, Order, SizeForSale
+from .models import (Category, Food, FoodMakeup, Size, FoodWeight, OrderingFood, Order, SizeForSale,
+                     DailyOrderStats, DailyFoodStats)
+from .signals import transition_order
+from .validators import validate_food_sizes
 
 
 @admin.register(Category)
@@ -60,12 +64,35 @@ class SizeForSaleStackedInline(NestedTabularInline):
     extra = 1
 
 
+class OrderingFoodInlineFormSet(NestedInlineFormSet):
+
+    def clean(self):
+        super().clean()
+        pairs = []
+        for form in self.forms:
+            if self._should_delete_form(form):
+                continue
+            food = form.cleaned_data.get('food')
+            for sizes_formset in getattr(form, 'nested_formsets', []):
+                if not sizes_formset.is_valid():
+                    continue
+                for size_form in sizes_formset.forms:
+                    size = size_form.cleaned_data.get('size')
+                    if food is not None and size is not None and not sizes_formset._should_delete_form(size_form):
+                        pairs.append((food.id, size.id))
+        validate_food_sizes(pairs)
+
+
 class OrderingFoodStackedInline(NestedTabularInline):
     model = OrderingFood
+    formset = OrderingFoodInlineFormSet
     extra = 1
     inlines = [SizeForSaleStackedInline,]
     readonly_fields = ('total_price', 'created_at', 'updated_at',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_total_price()
+
 
 class OrderAdminForm(forms.ModelForm):
 
@@ -82,9 +109,57 @@ class OrderAdmin(NestedModelAdmin):
     list_display_links = ('id', 'name',)
     search_fields = ('id', 'name', 'email', 'phone', 'address', 'home',)
     list_filter = ('created_at',)
-    readonly_fields = ('total_price', 'created_at', 'updated_at',)
+    readonly_fields = ('total_price', 'status', 'version', 'created_at', 'updated_at',)
     inlines = (OrderingFoodStackedInline,)
     form = OrderAdminForm
+    actions = ('mark_on_delivery', 'mark_delivered', 'mark_canceled',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_total_price()
+
+    def transition(self, request, queryset, status):
+        pks = list(queryset.values_list('pk', flat=True))
+        moved = sum(transition_order(pk, status)[0] is not None for pk in pks)
+        self.message_user(request, f'Статус изменён у {moved} из {len(pks)} заказов.')
+
+    @admin.action(description='Передать в доставку')
+    def mark_on_delivery(self, request, queryset):
+        self.transition(request, queryset, Order.ON_DELIVERY)
+
+    @admin.action(description='Отметить доставленными')
+    def mark_delivered(self, request, queryset):
+        self.transition(request, queryset, Order.DELIVERED)
+
+    @admin.action(description='Отменить')
+    def mark_canceled(self, request, queryset):
+        self.transition(request, queryset, Order.CANCELED)
+
+
+class ReadOnlyStatsAdmin(admin.ModelAdmin):
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Rows are derived from orders; rebuild them with rebuild_sales_stats instead.
+        return False
+
+
+@admin.register(DailyOrderStats)
+class DailyOrderStatsAdmin(ReadOnlyStatsAdmin):
+    list_display = ('date', 'status', 'orders', 'revenue',)
+    list_filter = ('status',)
+
+
+@admin.register(DailyFoodStats)
+class DailyFoodStatsAdmin(ReadOnlyStatsAdmin):
+    list_display = ('date', 'status', 'food', 'size', 'category', 'orders', 'quantity', 'revenue',)
+    list_filter = ('status', 'category',)
+    list_select_related = ('food', 'size', 'category',)
 
 
 # admin.site.register(Order, OrderAdmin)
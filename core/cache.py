@@ -0,0 +1,56 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+MENU_VERSION_KEY = 'menu:version'
+MENU_HITS_KEY = 'menu:hits'
+MENU_MISSES_KEY = 'menu:misses'
+
+
+def get_menu_cache():
+    return caches[getattr(settings, 'MENU_CACHE_ALIAS', 'default')]
+
+
+def _incr(key, delta=1):
+    cache = get_menu_cache()
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key, delta)
+
+
+def get_menu_version():
+    cache = get_menu_cache()
+    version = cache.get(MENU_VERSION_KEY)
+    if version is None:
+        # Starting from a timestamp keeps an evicted version from reusing stale keys.
+        cache.add(MENU_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(MENU_VERSION_KEY)
+    return version
+
+
+def bump_menu_version():
+    get_menu_version()
+    return _incr(MENU_VERSION_KEY)
+
+
+def get_menu_cache_key(request):
+    query = sorted((key, value) for key, values in request.query_params.lists() for value in values)
+    raw = f'{request.get_host()}{request.path}?{query}'
+    return f'menu:{get_menu_version()}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def record_menu_cache_hit(hit):
+    _incr(MENU_HITS_KEY if hit else MENU_MISSES_KEY)
+
+
+def get_menu_cache_stats():
+    cache = get_menu_cache()
+    return {
+        'version': get_menu_version(),
+        'hits': cache.get(MENU_HITS_KEY, 0),
+        'misses': cache.get(MENU_MISSES_KEY, 0),
+    }
@@ -0,0 +1,54 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.urls import router
+
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?!CONSTANT ROW)(\w+)(?!.*\b(?:USING|VIRTUAL TABLE)\b)'),
+    'postgresql': re.compile(r'\bSeq Scan on (\w+)'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN for the list query of every API viewset and fails if any of them does a full table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--param', action='append', default=[], metavar='KEY=VALUE',
+                            help='Query parameter passed to every list request, e.g. --param status=waiting')
+        parser.add_argument('--exclude', action='append', default=[], metavar='PREFIX',
+                            help='Router prefix to skip, e.g. --exclude categories')
+
+    def handle(self, *args, **options):
+        params = dict(param.split('=', 1) for param in options['param'])
+        factory = APIRequestFactory()
+        failures = []
+        for prefix, viewset, basename in router.registry:
+            if prefix in options['exclude']:
+                continue
+
+            request = Request(factory.get(f'/{prefix}/', params))
+            view = viewset(action='list')
+            view.request, view.args, view.kwargs, view.format_kwarg = request, (), {}, None
+            queryset = view.filter_queryset(view.get_queryset())
+            page_size = view.paginator.get_page_size(request) if view.paginator is not None else None
+            if page_size:
+                queryset = queryset[:page_size]
+
+            plan = queryset.explain()
+            pattern = FULL_SCAN_PATTERNS.get(connections[queryset.db].vendor)
+            tables = sorted({match.group(1) for match in pattern.finditer(plan)}) if pattern else []
+            if tables:
+                failures.append(prefix)
+                self.stdout.write(self.style.ERROR(f'{prefix}: full scan of {", ".join(tables)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{prefix}: ok'))
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'Full table scans in: {", ".join(failures)}')
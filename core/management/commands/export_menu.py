@@ -0,0 +1,35 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.menu_io import export_records, write_records
+
+
+class Command(BaseCommand):
+    help = 'Exports categories, food, sizes, makeups and weights as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='File to write, "-" for stdout')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None,
+                            help='Defaults to the file extension, jsonl for stdout')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        stream = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8', newline='')
+
+        started = time.monotonic()
+        done = 0
+        try:
+            for done, _ in enumerate(write_records(stream, export_records(options['chunk_size']), fmt), 1):
+                pass
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {done} rows in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
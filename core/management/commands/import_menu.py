@@ -0,0 +1,39 @@
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from core.menu_io import read_records, import_records
+
+
+class Command(BaseCommand):
+    help = 'Imports categories, food, sizes, makeups and weights from CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to read, "-" for stdin')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None,
+                            help='Defaults to the file extension, jsonl for stdin')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+
+        started = time.monotonic()
+        done = 0
+        try:
+            for done in import_records(read_records(stream, fmt), options['chunk_size']):
+                if options['verbosity'] > 1:
+                    self.stderr.write(f'{done} rows, {done / (time.monotonic() - started):.0f} rows/s')
+        except ValidationError as e:
+            raise CommandError(f'Imported {done} rows, then stopped: {"; ".join(e.messages)}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {done} rows in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
@@ -0,0 +1,29 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.stats import refresh_sales_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds daily order and food sales statistics from orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, help='First day to rebuild, YYYY-MM-DD')
+        parser.add_argument('--until', type=date.fromisoformat, help='Last day to rebuild, YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        since, until = options['since'], options['until']
+        if since is None and until is None:
+            refresh_sales_stats()
+            self.stdout.write(self.style.SUCCESS('Rebuilt sales statistics for all days'))
+            return
+
+        until = until or timezone.localdate()
+        since = since or until
+        day = since
+        while day <= until:
+            refresh_sales_stats([day + timedelta(days=offset) for offset in range(min(31, (until - day).days + 1))])
+            day += timedelta(days=31)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales statistics from {since} to {until}'))
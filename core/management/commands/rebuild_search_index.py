@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from core.search import get_food_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of food'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        index = get_food_index(options['database'], create=True)
+        if index is None:
+            raise CommandError('Full-text search is not supported by this database')
+        with transaction.atomic(using=options['database']):
+            count = index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} food'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from account.models import User
+from core.models import Food
+from utils.images import build_image_variants, IMAGE_READY
+
+
+class Command(BaseCommand):
+    help = 'Renders responsive variants of food images and avatars that were stored without them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render variants of every image, e.g. after '
+                                                               'IMAGE_VARIANTS changed')
+
+    def handle(self, *args, **options):
+        count = 0
+        for model, field_name in ((Food, 'image'), (User, 'avatar')):
+            field = model._meta.get_field(field_name)
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).filter(
+                **{field.status_field: IMAGE_READY}
+            )
+            if not options['all']:
+                queryset = queryset.filter(**{field.variants_field: {}})
+            for instance in queryset.iterator(chunk_size=500):
+                if build_image_variants(instance, field_name):
+                    count += 1
+        self.stdout.write(self.style.SUCCESS(f'Rendered variants of {count} images'))
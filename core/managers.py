@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+PRICE_FIELD = models.DecimalField(max_digits=12, decimal_places=2)
+
+
+def _total_price_subquery(**filters):
+    from core.models import SizeForSale
+
+    totals = (
+        SizeForSale.objects
+        .filter(**filters)
+        .order_by()
+        .values(*filters)
+        .annotate(total=Sum(F('size__price') * F('quantity'), output_field=PRICE_FIELD))
+        .values('total')
+    )
+    return Coalesce(Subquery(totals, output_field=PRICE_FIELD), Value(Decimal('0.00')), output_field=PRICE_FIELD)
+
+
+class OrderQuerySet(models.QuerySet):
+
+    def with_total_price(self):
+        return self.annotate(annotated_total_price=_total_price_subquery(ordering_food__order=OuterRef('pk')))
+
+    def transition(self, pk, status, version=None):
+        """
+        Moves the order to `status` with a conditional UPDATE that only matches while
+        the row still has the status and version read just before, and when given,
+        `version`. Returns the previous status, or None when the order did not move.
+        """
+        current = self.filter(pk=pk).values_list('status', 'version').first()
+        if current is None or status not in self.model.ORDER_TRANSITIONS.get(current[0], ()):
+            return None
+        if version is not None and version != current[1]:
+            return None
+        updated = self.filter(pk=pk, status=current[0], version=current[1]).update(
+            status=status, version=F('version') + 1, updated_at=timezone.now()
+        )
+        return current[0] if updated else None
+
+
+class OrderingFoodQuerySet(models.QuerySet):
+
+    def with_total_price(self):
+        return self.annotate(annotated_total_price=_total_price_subquery(ordering_food=OuterRef('pk')))
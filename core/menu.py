@@ -0,0 +1,82 @@
+import gzip
+import hashlib
+import threading
+from collections import namedtuple
+
+from core.cache import get_menu_version
+from core.models import Category, Food
+from core.renderers import ORJSONRenderer
+from core.serializers import CategorySerializer, ReadFoodSerializer
+from utils.db import read_from_primary
+from utils.querysets import optimize_queryset
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MenuBuild = namedtuple('MenuBuild', 'version foods content etag')
+
+
+class MenuSnapshot:
+    """
+    Whole category -> food tree rendered once per menu version and host and kept
+    in memory together with its gzip/brotli encodings. Foods whose updated_at did
+    not move are reused from the previous build instead of being serialized again.
+    Only the `max_hosts` most recently built hosts are kept, since with
+    ALLOWED_HOSTS = ['*'] clients choose the Host header.
+    """
+    max_hosts = 4
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._builds = {}
+
+    def get(self, request):
+        """
+        Returns the MenuBuild of the current menu version with URLs for the host of
+        `request`. Builds are replaced as a whole, so content and etag always match.
+        """
+        base_url = request.build_absolute_uri('/')
+        version = get_menu_version()
+        build = self._builds.get(base_url)
+        if build is None or build.version != version:
+            with self._lock:
+                build = self._builds.get(base_url)
+                if build is None or build.version != version:
+                    with read_from_primary():
+                        build = self._build(version, request, build.foods if build is not None else {})
+                    self._builds.pop(base_url, None)
+                    self._builds[base_url] = build
+                    while len(self._builds) > self.max_hosts:
+                        del self._builds[next(iter(self._builds))]
+        return build
+
+    def _build(self, version, request, previous):
+        context = {'request': request}
+        rows = list(Food.objects.values_list('id', 'category_id', 'updated_at'))
+        stale = [pk for pk, _, updated_at in rows if previous.get(pk, (None,))[0] != updated_at]
+        foods = {pk: previous[pk] for pk, _, _ in rows if pk in previous}
+        if stale:
+            serializer = ReadFoodSerializer()
+            for food in optimize_queryset(Food.objects.filter(id__in=stale), serializer):
+                foods[food.id] = (food.updated_at, ReadFoodSerializer(food, context=context).data)
+
+        foods_by_category = {}
+        for pk, category_id, _ in rows:
+            foods_by_category.setdefault(category_id, []).append(foods[pk][1])
+        menu = [
+            {**category, 'foods': foods_by_category.get(category['id'], [])}
+            for category in CategorySerializer(Category.objects.order_by('id'), many=True, context=context).data
+        ]
+
+        raw = ORJSONRenderer().render(menu)
+        content = {'identity': raw, 'gzip': gzip.compress(raw)}
+        if brotli is not None:
+            content['br'] = brotli.compress(raw)
+        # Weak, since the same ETag is sent for every Content-Encoding of the menu.
+        return MenuBuild(version, foods, content, f'W/"{hashlib.md5(raw).hexdigest()}"')
+
+
+menu_snapshot = MenuSnapshot()
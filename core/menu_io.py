@@ -0,0 +1,191 @@
+import csv
+import json
+from decimal import Decimal
+from functools import partial
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Category, Food, Size, FoodMakeup, FoodWeight, SizeForSale
+from core.signals import bulk_menu_changes
+from utils.images import image_queue, IMAGE_PENDING, IMAGE_READY
+
+# One record per food; list columns are JSON-encoded in CSV. Records without `name` only declare a category.
+CSV_FIELDS = ('category', 'name', 'description', 'image', 'sizes', 'makeups', 'weight')
+LIST_FIELDS = ('sizes', 'makeups', 'weight')
+
+
+def read_records(stream, fmt):
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            for field in LIST_FIELDS:
+                row[field] = json.loads(row[field]) if row.get(field) else []
+            yield row
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_records(stream, records, fmt):
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, CSV_FIELDS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow({
+                key: json.dumps(value, ensure_ascii=False) if key in LIST_FIELDS else value
+                for key, value in record.items()
+            })
+            yield record
+    else:
+        for record in records:
+            stream.write(json.dumps(record, ensure_ascii=False))
+            stream.write('\n')
+            yield record
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def export_records(chunk_size=1000):
+    food_categories = Food.objects.values('category_id')
+    for name in Category.objects.exclude(id__in=food_categories).order_by('id').values_list('name', flat=True):
+        yield {'category': name}
+
+    foods = (
+        Food.objects
+        .select_related('category')
+        .prefetch_related('sizes', 'makeups', 'weight')
+        .order_by('id')
+    )
+    for food in foods.iterator(chunk_size=chunk_size):
+        yield {
+            'category': food.category.name,
+            'name': food.name,
+            'description': food.description,
+            'image': food.image.name,
+            'sizes': [{'name': size.name, 'price': str(size.price)} for size in food.sizes.all()],
+            'makeups': [makeup.name for makeup in food.makeups.all()],
+            'weight': [str(weight.value) for weight in food.weight.all()],
+        }
+
+
+def _get_categories(names):
+    categories = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = [Category(name=name) for name in names if name not in categories]
+    categories.update((category.name, category.id) for category in Category.objects.bulk_create(missing))
+    return categories
+
+
+def _sync_sizes(foods, records):
+    existing = {}
+    for size in Size.objects.filter(food_id__in=[food.id for food in foods]):
+        existing.setdefault(size.food_id, {})[size.name] = size
+
+    to_create, to_update, to_delete = [], [], []
+    for food, record in zip(foods, records):
+        current = existing.get(food.id, {})
+        for item in record.get('sizes', []):
+            size = current.pop(item['name'], None)
+            price = Decimal(str(item['price']))
+            if size is None:
+                to_create.append(Size(food=food, name=item['name'], price=price))
+            elif size.price != price:
+                size.price = price
+                to_update.append(size)
+        to_delete += [size.id for size in current.values()]
+
+    Size.objects.bulk_create(to_create)
+    Size.objects.bulk_update(to_update, ['price'])
+    # Sizes that were already ordered stay, so order history is not cascaded away.
+    ordered = SizeForSale.objects.filter(size_id__in=to_delete).values('size_id')
+    Size.objects.filter(id__in=to_delete).exclude(id__in=ordered).delete()
+
+
+def validate_records(records, start=0):
+    """Raises ValidationError naming the records (counted from 1 after `start`) that can not be imported."""
+    errors = []
+    for number, record in enumerate(records, start=start + 1):
+        if not isinstance(record, dict):
+            errors.append(f'Record {number}: expected an object')
+        elif not record.get('category'):
+            errors.append(f'Record {number}: "category" is required')
+    if errors:
+        raise ValidationError(errors)
+
+
+def import_chunk(records):
+    """
+    Upserts one chunk of records with bulk queries; foods are matched by category
+    and name, and of records for the same food the last one wins. Returns the ids
+    of the foods it touched.
+    """
+    validate_records(records)
+    categories = _get_categories({record['category'] for record in records})
+    records = list({
+        (record['category'], record['name']): record for record in records if record.get('name')
+    }.values())
+
+    existing = {
+        (food.category_id, food.name): food
+        for food in Food.objects.filter(category_id__in=categories.values(),
+                                        name__in={record['name'] for record in records})
+    }
+    now = timezone.now()
+    foods, to_create, to_update, images = [], [], [], []
+    for record in records:
+        key = (categories[record['category']], record['name'])
+        food = existing.get(key)
+        if food is None:
+            food = existing[key] = Food(category_id=key[0], name=record['name'])
+            to_create.append(food)
+        elif food not in to_update:
+            to_update.append(food)
+        food.description = record.get('description', '')
+        # Records without an image keep the current one; a new image gets its variants rendered after commit.
+        if 'image' in record and (food._state.adding or food.image.name != (record['image'] or '')):
+            food.image = record['image'] or ''
+            food.image_status = IMAGE_PENDING if food.image else IMAGE_READY
+            food.image_variants = {}
+            if food.image:
+                images.append(food)
+        food.updated_at = now
+        foods.append(food)
+
+    Food.objects.bulk_create(to_create)
+    Food.objects.bulk_update(to_update, ['description', 'image', 'image_status', 'image_variants', 'updated_at'])
+    for food in images:
+        transaction.on_commit(partial(image_queue.submit, food, 'image', resize=False))
+
+    _sync_sizes(foods, records)
+    food_ids = [food.id for food in foods]
+    FoodMakeup.objects.filter(food_id__in=food_ids).delete()
+    FoodMakeup.objects.bulk_create(
+        FoodMakeup(food=food, name=name) for food, record in zip(foods, records) for name in record.get('makeups', [])
+    )
+    FoodWeight.objects.filter(food_id__in=food_ids).delete()
+    FoodWeight.objects.bulk_create(
+        FoodWeight(food=food, value=Decimal(str(value)))
+        for food, record in zip(foods, records) for value in record.get('weight', [])
+    )
+    return food_ids
+
+
+def import_records(records, chunk_size=1000):
+    """
+    Imports records chunk by chunk, each in its own transaction, yielding the number
+    of records done after every chunk. A chunk with invalid records raises
+    ValidationError before anything of it is written.
+    """
+    done = 0
+    for chunk in chunked(records, chunk_size):
+        validate_records(chunk, done)
+        with transaction.atomic(), bulk_menu_changes() as food_ids:
+            food_ids.update(import_chunk(chunk))
+        done += len(chunk)
+        yield done
@@ -1,5 +1,21 @@
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
+from core.cache import get_menu_cache, get_menu_cache_key, record_menu_cache_hit
+from utils.db import read_from_primary
+from utils.querysets import optimize_queryset
+from utils.serializers import parse_field_paths, prune_serializer
+from utils.values import compile_values_plan
+
 
 class SerializeByActionMixin:
     serializer_classes = {}
@@ -25,9 +41,199 @@ class PermissionByActionMixin:
         return [permission() for permission in permission_classes]
 
 
+class PrefetchBySerializerMixin:
+    """
+    Plans select_related/prefetch_related from the serializer of the current action,
+    so nested serializers are rendered in a constant number of queries. Reads also
+    load only the columns the serializer renders.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action is None:
+            return queryset
+        try:
+            self.get_serializer_class()
+        except AssertionError:
+            # Actions without a serializer, like destroy, render nothing to plan for.
+            return queryset
+        return optimize_queryset(queryset, self.get_serializer(), only=self.request.method in SAFE_METHODS)
+
+
+class SparseFieldsMixin:
+    """
+    Lets read requests pick fields with `?fields=id,category.name` and keep only the
+    nested serializers named in `?expand=category`; the others collapse to primary
+    keys. Unknown field names are answered with 400. The pruned serializer also
+    drives the query plan.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return serializer
+
+        # Empty trees like `?fields=,` select nothing and are ignored.
+        fields = parse_field_paths(request.query_params.get(self.fields_query_param, '')) or None
+        expand = request.query_params.get(self.expand_query_param)
+        if fields is None and expand is None:
+            return serializer
+        return prune_serializer(serializer, fields, parse_field_paths(expand) if expand is not None else None)
+
+
+class MenuCacheMixin:
+    """
+    Caches response data of `cache_actions` under the current menu version,
+    which is bumped whenever a catalog model changes.
+    """
+    cache_actions = ()
+    cache_timeout = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request, *args, **kwargs)
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.cache_actions:
+            return handler(request, *args, **kwargs)
+
+        cache = get_menu_cache()
+        key = get_menu_cache_key(request)
+        data = cache.get(key)
+        record_menu_cache_hit(data is not None)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        # A lagging replica would otherwise leave stale data cached under the new menu version.
+        with read_from_primary():
+            response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.get_cache_timeout())
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def get_cache_timeout(self):
+        return self.cache_timeout if self.cache_timeout is not None else settings.MENU_CACHE_TIMEOUT
+
+
+class ConditionalGetMixin:
+    """
+    Answers `conditional_actions` with 304 Not Modified when the weak ETag or
+    Last-Modified, built from Max('updated_at') and the row count of the filtered
+    queryset, still matches what the client has.
+    """
+    conditional_actions = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def get_conditional_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+
+        try:
+            state = self.get_conditional_queryset().aggregate(**self.get_conditional_aggregates())
+        except (ValueError, TypeError, ValidationError):
+            # Malformed lookups, like /food/abc/, get the handler's 404.
+            return handler(request, *args, **kwargs)
+        etag, last_modified = self.get_conditional_validators(request, state)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+
+        response = handler(request, *args, **kwargs)
+        self.set_conditional_headers(response, etag, last_modified)
+        return response
+
+    def get_conditional_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset.order_by()
+
+    def get_conditional_aggregates(self):
+        return {'last_modified': Max('updated_at'), 'count': Count('pk')}
+
+    def get_conditional_validators(self, request, state):
+        last_modified = state['last_modified'] and int(state['last_modified'].timestamp())
+        changed = state['last_modified'] and state['last_modified'].isoformat()
+        raw = f'{request.get_full_path()}:{state["count"]}:{changed}'
+        return f'W/"{hashlib.md5(raw.encode()).hexdigest()}"', last_modified
+
+    def set_conditional_headers(self, response, etag, last_modified):
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+
+
+class ValuesListMixin:
+    """
+    Renders `list` from `.values()` rows through a plan compiled from the list
+    serializer when `fast_list` is on, skipping model instances and per-field
+    dispatch. Serializers the plan can not reproduce fall back to the usual path.
+    """
+    fast_list = False
+
+    def list(self, request, *args, **kwargs):
+        if not self.fast_list:
+            return super().list(request, *args, **kwargs)
+        serializer = self.get_serializer(many=True)
+        plan = compile_values_plan(serializer)
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        columns = list(plan.columns)
+        for ordering in queryset.query.order_by:
+            # Cursor pagination reads its position from the ordering columns.
+            if isinstance(ordering, str) and ordering.lstrip('-') not in columns + ['?']:
+                columns.append(ordering.lstrip('-'))
+        rows = queryset.prefetch_related(None).values(*columns)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(rows))
+
+
+class PaginationByQueryParamMixin:
+    """
+    Lets clients opt into one of `pagination_classes` with `?pagination=<name>`,
+    falling back to `pagination_class`.
+    """
+    pagination_query_param = 'pagination'
+    pagination_classes = {}
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            name = self.request.query_params.get(self.pagination_query_param) if self.request else None
+            pagination_class = self.pagination_classes.get(name, self.pagination_class)
+            self._paginator = pagination_class() if pagination_class is not None else None
+        return self._paginator
+
+
 class UltraModelViewSet(
     PermissionByActionMixin,
     SerializeByActionMixin,
+    PaginationByQueryParamMixin,
+    ConditionalGetMixin,
+    MenuCacheMixin,
+    ValuesListMixin,
+    SparseFieldsMixin,
+    PrefetchBySerializerMixin,
     ModelViewSet
 ):
-    pass
\ No newline at end of file
+    pass
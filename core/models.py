@@ -1,12 +1,12 @@
 from django.db import models
-from django.core.exceptions import ValidationError
-
-from django_resized import ResizedImageField
 
 from phonenumber_field.modelfields import PhoneNumberField
 
+from utils.images import DeferredResizedImageField, IMAGE_STATUS, IMAGE_READY
 from utils.models import TimeStampAbstractModel
 
+from core.managers import OrderQuerySet, OrderingFoodQuerySet
+
 
 class Category(TimeStampAbstractModel):
     class Meta:
@@ -22,7 +22,11 @@ class Category(TimeStampAbstractModel):
 class Food(TimeStampAbstractModel):
 
     name = models.CharField('название', max_length=100)
-    image = ResizedImageField('изображение', upload_to='food_images/', force_format='WEBP', quality=90)
+    image = DeferredResizedImageField('изображение', upload_to='food_images/', size=[1920, 1080], force_format='WEBP',
+                                      quality=90, status_field='image_status', variants_field='image_variants')
+    image_status = models.CharField('статус изображения', choices=IMAGE_STATUS, default=IMAGE_READY, max_length=20,
+                                    editable=False)
+    image_variants = models.JSONField('варианты изображения', default=dict, blank=True, editable=False)
     description = models.CharField('описание', max_length=255, help_text='Просто описание')
     category = models.ForeignKey('core.Category', models.PROTECT, verbose_name='категория',
                                  help_text='Выберите категорию')
@@ -31,6 +35,10 @@ class Food(TimeStampAbstractModel):
         verbose_name = 'блюда'
         verbose_name_plural = 'блюда'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at'], name='food_created_at_idx'),
+            models.Index(fields=['category', '-created_at'], name='food_category_created_at_idx'),
+        ]
 
     def __str__(self):
         return f'{self.name}'
@@ -41,6 +49,9 @@ class Size(TimeStampAbstractModel):
     class Meta:
         verbose_name = 'размер'
         verbose_name_plural = 'размеры'
+        indexes = [
+            models.Index(fields=['food', 'price'], name='size_food_price_idx'),
+        ]
 
     name = models.CharField('название', max_length=150,)
     price = models.DecimalField('цена', max_digits=10, decimal_places=2, default=0.0)
@@ -56,6 +67,10 @@ class FoodMakeup(TimeStampAbstractModel):
         verbose_name = 'состав блюда'
         verbose_name_plural = 'состав блюда'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at'], name='foodmakeup_created_at_idx'),
+            models.Index(fields=['food', '-created_at'], name='foodmakeup_food_created_at_idx'),
+        ]
 
     name = models.CharField('название', max_length=100)
     food = models.ForeignKey('core.Food', models.CASCADE, 'makeups', verbose_name='блюда')
@@ -70,6 +85,10 @@ class FoodWeight(TimeStampAbstractModel):
         verbose_name = 'вес блюда'
         verbose_name_plural = 'весы блюда'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at'], name='foodweight_created_at_idx'),
+            models.Index(fields=['food', '-created_at'], name='foodweight_food_created_at_idx'),
+        ]
 
     value = models.DecimalField('вес', max_digits=10, decimal_places=3, default=0.0)
     food = models.ForeignKey('core.Food', models.CASCADE, 'weight', verbose_name='блюда')
@@ -83,6 +102,11 @@ class Order(TimeStampAbstractModel):
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], name='order_created_at_id_idx'),
+            models.Index(fields=['status', '-created_at'], name='order_status_created_at_idx'),
+            models.Index(fields=['email'], name='order_email_idx'),
+        ]
 
     WAITING = 'waiting'
     CANCELED = 'canceled'
@@ -95,18 +119,35 @@ class Order(TimeStampAbstractModel):
         (ON_DELIVERY, 'Доставляется'),
         (DELIVERED, 'Доставлено')
     )
+    ORDER_TRANSITIONS = {
+        WAITING: (ON_DELIVERY, CANCELED),
+        ON_DELIVERY: (DELIVERED, CANCELED),
+    }
     name = models.CharField('имя и фамилия', max_length=140)
     email = models.EmailField('электронная почта')
     phone = PhoneNumberField('номер телефона')
     address = models.CharField('адрес', max_length=255)
     home = models.CharField('номер квартара или дома', max_length=150)
     status = models.CharField('статус', choices=ORDER_STATUS, default=WAITING, max_length=20)
+    version = models.PositiveIntegerField('версия статуса', default=0, editable=False)
+
+    objects = OrderQuerySet.as_manager()
 
     def __str__(self):
         return f'{self.name} - {self.email}'
 
+    def save(self, *args, update_fields=None, **kwargs):
+        # status and version only move through Order.objects.transition(), so saving an instance
+        # loaded before a transition can not roll it back.
+        if update_fields is None and not self._state.adding:
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.name not in ('status', 'version')]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
     @property
     def total_price(self):
+        if hasattr(self, 'annotated_total_price'):
+            return self.annotated_total_price
         return sum(item.total_price for item in self.ordering_food.all())
 
     total_price.fget.short_description = 'Итоговая цена'
@@ -125,25 +166,73 @@ class SizeForSale(TimeStampAbstractModel):
     def total_price(self):
         return self.size.price * self.quantity
 
-    def clean(self):
-        sizes = Size.objects.filter(food=self.ordering_food.food)
-        for size in sizes:
-            if not size.id == self.size.id:
-                raise ValidationError(message="the food does not include this size")
-
 
 class OrderingFood(TimeStampAbstractModel):
 
     class Meta:
         verbose_name = 'блюда для заказа'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], name='orderingfood_created_at_id_idx'),
+            models.Index(fields=['order', '-created_at'], name='orderingfood_order_created_idx'),
+        ]
 
     order = models.ForeignKey('core.Order', models.CASCADE, 'ordering_food', verbose_name='заказ')
     food = models.ForeignKey('core.Food', models.PROTECT, verbose_name='блюда')
 
+    objects = OrderingFoodQuerySet.as_manager()
+
     @property
     def total_price(self):
+        if hasattr(self, 'annotated_total_price'):
+            return self.annotated_total_price
         return sum(item.total_price for item in self.sizes_for_sale.all())
 
     def __str__(self):
-        return f'{self.order} - {self.food}'
\ No newline at end of file
+        return f'{self.order} - {self.food}'
+
+
+class DailyOrderStats(TimeStampAbstractModel):
+
+    class Meta:
+        verbose_name = 'статистика заказов за день'
+        verbose_name_plural = 'статистика заказов по дням'
+        ordering = ('-date', 'status')
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status'], name='dailyorderstats_date_status_uniq'),
+        ]
+
+    date = models.DateField('дата')
+    status = models.CharField('статус', choices=Order.ORDER_STATUS, max_length=20)
+    orders = models.PositiveIntegerField('заказы', default=0)
+    revenue = models.DecimalField('выручка', max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'{self.date} - {self.status}'
+
+
+class DailyFoodStats(TimeStampAbstractModel):
+
+    class Meta:
+        verbose_name = 'статистика блюд за день'
+        verbose_name_plural = 'статистика блюд по дням'
+        ordering = ('-date', 'food_id', 'size_id')
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status', 'food', 'size'], name='dailyfoodstats_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['food', 'date'], name='dailyfoodstats_food_date_idx'),
+            models.Index(fields=['category', 'date'], name='dailyfoodstats_cat_date_idx'),
+        ]
+
+    date = models.DateField('дата')
+    status = models.CharField('статус', choices=Order.ORDER_STATUS, max_length=20)
+    food = models.ForeignKey('core.Food', models.CASCADE, verbose_name='блюда')
+    category = models.ForeignKey('core.Category', models.CASCADE, verbose_name='категория')
+    size = models.ForeignKey('core.Size', models.CASCADE, verbose_name='размер')
+    orders = models.PositiveIntegerField('заказы', default=0)
+    quantity = models.PositiveIntegerField('количество', default=0)
+    revenue = models.DecimalField('выручка', max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'{self.date} - {self.food} - {self.size}'
@@ -1,7 +1,58 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import InvalidPage
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 
 class SimpleResultPagination(PageNumberPagination):
     page_query_param = 'page'
     page_size_query_param = 'page_size'
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+
+
+class _CountedQuerySet:
+    """
+    Hands Django's Paginator a count fetched up front, so it never counts by itself.
+    """
+
+    def __init__(self, queryset, count):
+        self.queryset = queryset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        return self.queryset[key]
+
+
+class AsyncPageNumberPagination(SimpleResultPagination):
+    """
+    SimpleResultPagination that async views run through `apaginate_queryset`,
+    counting and fetching the page with the async ORM.
+    """
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(_CountedQuerySet(queryset, await queryset.acount()), page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return [obj async for obj in self.page.object_list]
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    ordering = ('-created_at', 'id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
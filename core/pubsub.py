@@ -0,0 +1,64 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class LocalBroker:
+    """
+    In-process fan-out of messages to asyncio subscribers. `publish` may be called
+    from any thread; it only reaches subscribers of the same process, so deployments
+    with several workers plug in a shared broker with the same interface instead.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, message)
+            except RuntimeError:
+                # The subscriber's loop is already closed.
+                pass
+
+    @staticmethod
+    def _put(queue, message):
+        if queue.full():
+            # A slow subscriber loses its oldest message rather than holding up publishers.
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(channel, set())
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    self._subscribers.pop(channel, None)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.ORDER_EVENTS_BROKER)()
+
+
+def get_order_channel(order_id):
+    return f'order:{order_id}'
+
+
+def publish_order_event(order_id, status, version):
+    get_broker().publish(get_order_channel(order_id), {'id': order_id, 'status': status, 'version': version})
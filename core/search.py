@@ -0,0 +1,160 @@
+import re
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models.expressions import RawSQL
+
+from rest_framework import filters
+
+from core.models import Food, FoodMakeup
+
+WORD_RE = re.compile(r'\w+')
+
+
+def get_food_documents(food_ids, using='default'):
+    makeups = {}
+    for food_id, name in FoodMakeup.objects.using(using).filter(food_id__in=food_ids).values_list('food_id', 'name'):
+        makeups.setdefault(food_id, []).append(name)
+    return [
+        (pk, name, description, ' '.join(makeups.get(pk, [])))
+        for pk, name, description in (
+            Food.objects.using(using).filter(id__in=food_ids).values_list('id', 'name', 'description')
+        )
+    ]
+
+
+class BaseFoodIndex:
+    table = 'core_food_search'
+    rank_ordering = 'search_rank'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def exists(self):
+        # Only a found table is remembered, so one created later by migrate, rebuild_search_index or another
+        # process is picked up by long-lived connections.
+        if not getattr(self.connection, 'food_search_ready', False):
+            self.connection.food_search_ready = self.table in self.connection.introspection.table_names()
+        return self.connection.food_search_ready
+
+    def create(self):
+        try:
+            with self.connection.cursor() as cursor:
+                for sql in self.create_sql:
+                    cursor.execute(sql)
+        except DatabaseError:
+            return False
+        self.connection.food_search_ready = True
+        return True
+
+    def update(self, food_ids):
+        food_ids = set(food_ids)
+        documents = get_food_documents(food_ids, self.connection.alias)
+        # Upserts keep concurrent reindexing of the same food from colliding on its key.
+        with transaction.atomic(using=self.connection.alias):
+            self.delete(food_ids - {document[0] for document in documents})
+            with self.connection.cursor() as cursor:
+                cursor.executemany(self.upsert_sql, documents)
+
+    def delete(self, food_ids):
+        food_ids = list(food_ids)
+        if food_ids:
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {self.table} WHERE {self.key} IN ({", ".join(["%s"] * len(food_ids))})', food_ids
+                )
+
+    def rebuild(self, chunk_size=1000):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+        food_ids = list(Food.objects.using(self.connection.alias).values_list('id', flat=True))
+        for start in range(0, len(food_ids), chunk_size):
+            self.update(food_ids[start:start + chunk_size])
+        return len(food_ids)
+
+    def search(self, queryset, terms):
+        words = [word for term in terms for word in WORD_RE.findall(term)]
+        if not words:
+            return None
+        query = self.get_query(words)
+        food_id = f'{self.connection.ops.quote_name(Food._meta.db_table)}."id"'
+        return queryset.filter(
+            id__in=RawSQL(self.match_sql, (query,))
+        ).annotate(
+            search_rank=RawSQL(f'{self.rank_sql} AND {self.key} = {food_id}', (query,))
+        ).order_by(self.rank_ordering)
+
+
+class SQLiteFoodIndex(BaseFoodIndex):
+    table = 'core_food_fts'
+    key = 'rowid'
+    create_sql = (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        f"name, description, makeups, tokenize = 'unicode61 remove_diacritics 2')",
+    )
+    upsert_sql = f'INSERT OR REPLACE INTO {table} (rowid, name, description, makeups) VALUES (%s, %s, %s, %s)'
+    match_sql = f'SELECT rowid FROM {table} WHERE {table} MATCH %s'
+    rank_sql = f'SELECT bm25({table}, 10.0, 2.0, 1.0) FROM {table} WHERE {table} MATCH %s'
+
+    def get_query(self, words):
+        return ' '.join(f'"{word}"*' for word in words)
+
+
+class PostgresFoodIndex(BaseFoodIndex):
+    key = 'food_id'
+    rank_ordering = '-search_rank'
+    create_sql = (
+        f'CREATE TABLE IF NOT EXISTS {BaseFoodIndex.table} ('
+        f'food_id bigint PRIMARY KEY REFERENCES core_food (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+        f'document tsvector NOT NULL)',
+        f'CREATE INDEX IF NOT EXISTS {BaseFoodIndex.table}_document_idx '
+        f'ON {BaseFoodIndex.table} USING GIN (document)',
+    )
+    upsert_sql = (
+        f"INSERT INTO {BaseFoodIndex.table} (food_id, document) VALUES (%s, "
+        f"setweight(to_tsvector('simple', %s), 'A') || "
+        f"setweight(to_tsvector('simple', %s), 'B') || "
+        f"setweight(to_tsvector('simple', %s), 'C')) "
+        f"ON CONFLICT (food_id) DO UPDATE SET document = EXCLUDED.document"
+    )
+    match_sql = f"SELECT food_id FROM {BaseFoodIndex.table} WHERE document @@ to_tsquery('simple', %s)"
+    rank_sql = (
+        f"SELECT ts_rank(document, to_tsquery('simple', %s)) FROM {BaseFoodIndex.table} WHERE true"
+    )
+
+    def get_query(self, words):
+        return ' & '.join(f'{word}:*' for word in words)
+
+
+FOOD_INDEXES = {
+    'sqlite': SQLiteFoodIndex,
+    'postgresql': PostgresFoodIndex,
+}
+
+
+def get_food_index(using='default', create=False):
+    """
+    Returns the food index of the database, None when it is not supported or was
+    not created yet. Only migrations and rebuild_search_index pass `create`, so
+    requests never run DDL.
+    """
+    connection = connections[using]
+    index_class = FOOD_INDEXES.get(connection.vendor)
+    if index_class is None:
+        return None
+    index = index_class(connection)
+    return index if index.exists() or create and index.create() else None
+
+
+class FoodSearchFilter(filters.SearchFilter):
+    """
+    `?search=` over the full-text food index (name, description and makeups) with
+    ranked prefix matching; falls back to SearchFilter where no index is available.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        index = get_food_index(queryset.db) if terms else None
+        result = index.search(queryset, terms) if index is not None else None
+        if result is None:
+            return super().filter_queryset(request, queryset, view)
+        return result
@@ -1,7 +1,18 @@
+from functools import partial
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+
 from rest_framework import serializers
 # from drf_writable_nested.serializers import WritableNestedModelSerializer
 
-from core.models import Category, Food, Size, FoodMakeup, FoodWeight, OrderingFood, Order, SizeForSale
+from core.models import (Category, Food, Size, FoodMakeup, FoodWeight, OrderingFood, Order, SizeForSale,
+                         DailyOrderStats, DailyFoodStats)
+from core.signals import bulk_menu_changes
+from core.stats import track_sales_stats
+from core.validators import validate_food_sizes
+from utils.images import image_queue, IMAGE_PENDING
+from utils.serializers import ImageVariantsField, BulkPrimaryKeyRelatedField
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -31,6 +42,7 @@ class FoodWeightForFoodCreationSerializer(serializers.ModelSerializer):
 
 
 class FoodSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField(source='image')
 
     class Meta:
         model = Food
@@ -42,20 +54,17 @@ class CreateFoodSerializer(serializers.ModelSerializer):
     sizes = SizeForFoodCreationSerializer(many=True)
     weight = FoodWeightForFoodCreationSerializer(many=True)
 
+    @transaction.atomic
     def create(self, validated_data):
         makeups = validated_data.pop('makeups', [])
         sizes = validated_data.pop('sizes', [])
         weight = validated_data.pop('weight', [])
-        food = super().create(validated_data)
-        makeups_serializer = FoodMakeupForFoodCreationSerializer(data=makeups)
-        makeups_serializer.is_valid(raise_exception=True)
-        makeups_serializer.save(food=food)
-        sizes_serializer = SizeForFoodCreationSerializer(data=sizes)
-        sizes_serializer.is_valid(raise_exception=True)
-        sizes_serializer.save(food=food)
-        weight_serializer = FoodWeightForFoodCreationSerializer(data=weight)
-        weight_serializer.is_valid(raise_exception=True)
-        weight_serializer.save(food=food)
+        with bulk_menu_changes() as food_ids:
+            food = super().create(validated_data)
+            FoodMakeup.objects.bulk_create([FoodMakeup(**item, food=food) for item in makeups])
+            Size.objects.bulk_create([Size(**item, food=food) for item in sizes])
+            FoodWeight.objects.bulk_create([FoodWeight(**item, food=food) for item in weight])
+            food_ids.add(food.id)
 
         return food
 
@@ -69,12 +78,195 @@ class ReadFoodSerializer(serializers.ModelSerializer):
     makeups = FoodMakeupForFoodCreationSerializer(many=True)
     sizes = SizeForFoodCreationSerializer(many=True)
     weight = FoodWeightForFoodCreationSerializer(many=True)
+    image_variants = ImageVariantsField(source='image')
 
     class Meta:
         model = Food
         fields = '__all__'
 
 
+class BatchFoodMakeupSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = FoodMakeup
+        fields = ('id', 'name')
+
+
+class BatchSizeSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Size
+        fields = ('id', 'name', 'price')
+
+
+class BatchFoodWeightSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = FoodWeight
+        fields = ('id', 'value')
+
+
+class BatchFoodListSerializer(serializers.ListSerializer):
+    """
+    Creates and updates a list of nested food payloads in one transaction with one
+    bulk query per model. Items with `id` update that food; nested lists are diffed
+    by child `id`: new children are created, changed ones updated and missing ones
+    deleted. Lists left out of an item are not touched.
+
+    JSON bodies can not carry files, so foods created by a batch have no image
+    until one is uploaded with PUT /food/<id>/.
+    """
+    children = {
+        'makeups': FoodMakeup,
+        'sizes': Size,
+        'weight': FoodWeight,
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child.fields['category'].prefetch(item.get('category') for item in data if isinstance(item, dict))
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        ids = [item['id'] for item in attrs if 'id' in item]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError({'id': ['food ids must be unique']})
+        self.existing_foods = Food.objects.in_bulk(ids)
+        missing = set(ids) - self.existing_foods.keys()
+        if missing:
+            raise serializers.ValidationError({'id': [f'food {food_id} does not exist' for food_id in sorted(missing)]})
+
+        self.existing_children = {}
+        removed_sizes = []
+        for field_name, model in self.children.items():
+            updated = [item for item in attrs if field_name in item]
+            current = {}
+            for child in model.objects.filter(food_id__in=[item['id'] for item in updated if 'id' in item]):
+                current.setdefault(child.food_id, {})[child.id] = child
+            self.existing_children[field_name] = current
+
+            for item in updated:
+                given = {child['id'] for child in item[field_name] if 'id' in child}
+                own = current.get(item.get('id'), {})
+                if given - own.keys():
+                    raise serializers.ValidationError({
+                        field_name: [f'{field_name} {child_id} does not belong to the food'
+                                     for child_id in sorted(given - own.keys())]
+                    })
+                if field_name == 'sizes':
+                    removed_sizes += own.keys() - given
+
+        if SizeForSale.objects.filter(size_id__in=removed_sizes).exists():
+            raise serializers.ValidationError({'sizes': ['sizes that were already ordered can not be removed']})
+
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        with bulk_menu_changes() as food_ids:
+            foods, changed = self.save_foods(validated_data)
+            for field_name, model in self.children.items():
+                changed |= self.save_children(foods, validated_data, field_name, model)
+            food_ids.update(changed)
+        return foods
+
+    def save_foods(self, validated_data):
+        foods, to_create, to_update, update_fields, images = [], [], [], set(), []
+        for item in validated_data:
+            data = {key: value for key, value in item.items() if key != 'id' and key not in self.children}
+            food = self.existing_foods.get(item.get('id'))
+            if food is None:
+                food = Food(**data)
+                to_create.append(food)
+            else:
+                changed = set()
+                for key, value in data.items():
+                    attname = Food._meta.get_field(key).attname
+                    old = getattr(food, attname)
+                    setattr(food, key, value)
+                    if key == 'image' or getattr(food, attname) != old:
+                        changed.add(key)
+                if changed:
+                    to_update.append(food)
+                    update_fields |= changed
+            if 'image' in data:
+                # bulk queries skip FileField.pre_save and the resize hooks, so both happen here.
+                food.image_status = IMAGE_PENDING
+                food.image_variants = {}
+                food.image.save(food.image.name, food.image.file, save=False)
+                images.append(food)
+            foods.append(food)
+
+        if images:
+            update_fields |= {'image_status', 'image_variants'}
+        Food.objects.bulk_create(to_create)
+        if to_update:
+            Food.objects.bulk_update(to_update, update_fields)
+        for food in images:
+            transaction.on_commit(partial(image_queue.submit, food, 'image'))
+        return foods, {food.id for food in to_create + to_update}
+
+    def save_children(self, foods, validated_data, field_name, model):
+        existing = self.existing_children[field_name]
+        to_create, to_update, to_delete, update_fields, changed = [], [], [], set(), set()
+        for food, item in zip(foods, validated_data):
+            if field_name not in item:
+                continue
+            current = dict(existing.get(food.id, {}))
+            for data in item[field_name]:
+                data = dict(data)
+                child = current.pop(data.pop('id', None), None)
+                if child is None:
+                    to_create.append(model(**data, food=food))
+                    changed.add(food.id)
+                    continue
+                fields = {key for key, value in data.items() if getattr(child, key) != value}
+                if fields:
+                    for key in fields:
+                        setattr(child, key, data[key])
+                    to_update.append(child)
+                    update_fields |= fields
+                    changed.add(food.id)
+            if current:
+                to_delete += current.keys()
+                changed.add(food.id)
+
+        if to_delete:
+            model.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            model.objects.bulk_update(to_update, update_fields)
+        model.objects.bulk_create(to_create)
+        return changed
+
+
+class BatchFoodSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    category = BulkPrimaryKeyRelatedField(queryset=Category.objects.all(), required=False)
+    makeups = BatchFoodMakeupSerializer(many=True, required=False)
+    sizes = BatchSizeSerializer(many=True, required=False)
+    weight = BatchFoodWeightSerializer(many=True, required=False)
+
+    class Meta:
+        model = Food
+        fields = ('id', 'name', 'image', 'description', 'category', 'makeups', 'sizes', 'weight')
+        list_serializer_class = BatchFoodListSerializer
+        extra_kwargs = {
+            'name': {'required': False},
+            'image': {'required': False},
+            'description': {'required': False},
+        }
+
+    def validate(self, attrs):
+        if 'id' not in attrs:
+            missing = [name for name in ('name', 'description', 'category') if name not in attrs]
+            if missing:
+                raise serializers.ValidationError({name: ['This field is required.'] for name in missing})
+        return attrs
+
+
 class FoodSizeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Size
@@ -110,16 +302,18 @@ class OrderingFoodForReadOrderSerializer(serializers.ModelSerializer):
 
 class OrderSerializer(serializers.ModelSerializer):
     ordering_food = OrderingFoodForReadOrderSerializer(many=True, read_only=True)
+    total_price = serializers.ReadOnlyField()
 
     class Meta:
         model = Order
         fields = '__all__'
+        read_only_fields = ('status',)
+        annotated_fields = {'total_price': 'annotated_total_price'}
 
-    def to_representation(self, instance):
-        ret = super().to_representation(instance)
-        total_price = sum(item.total_price for item in instance.ordering_food.all())
-        ret.setdefault('total_price', total_price)
-        return ret
+
+class OrderTransitionSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Order.ORDER_STATUS)
+    version = serializers.IntegerField(required=False, min_value=0)
 
 
 class SizesForCreateOrderFoodSerializer(serializers.ModelSerializer):
@@ -142,6 +336,7 @@ class CreateOrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
+        read_only_fields = ('status',)
 
     def validate(self, attrs):
         if len(attrs['name']) < 3:
@@ -151,16 +346,28 @@ class CreateOrderSerializer(serializers.ModelSerializer):
                 ]
             })
 
+        try:
+            validate_food_sizes((item['food'].id, size['size'].id)
+                                for item in attrs.get('ordering_food', []) for size in item['sizes_for_sale'])
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'ordering_food': e.messages})
+
         return attrs
 
+    @transaction.atomic
     def create(self, validated_data):
         ordering_food = validated_data.pop('ordering_food', [])
         order = Order.objects.create(**validated_data)
-        for food in ordering_food:
-            sizes_for_sale = food.pop('sizes_for_sale', [])
-            order_food = OrderingFood.objects.create(**food, order=order)
-            for item in sizes_for_sale:
-                SizeForSale.objects.create(**item, ordering_food=order_food)
+        # bulk_create sends no signals, so the lines are added to the sales stats here.
+        with track_sales_stats([order.id]):
+            order_foods = OrderingFood.objects.bulk_create(
+                [OrderingFood(food=item['food'], order=order) for item in ordering_food]
+            )
+            SizeForSale.objects.bulk_create([
+                SizeForSale(**size, ordering_food=order_food)
+                for order_food, item in zip(order_foods, ordering_food)
+                for size in item.get('sizes_for_sale', [])
+            ])
         return order
 
 
@@ -169,3 +376,26 @@ class OrderingFoodSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderingFood
         fields = '__all__'
+
+    def validate(self, attrs):
+        food = attrs.get('food')
+        if self.instance is not None and food is not None and food.id != self.instance.food_id:
+            try:
+                validate_food_sizes((food.id, size_id)
+                                    for size_id in self.instance.sizes_for_sale.values_list('size_id', flat=True))
+            except DjangoValidationError as e:
+                raise serializers.ValidationError({'food': e.messages})
+
+        return attrs
+
+
+class DailyOrderStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyOrderStats
+        fields = ('date', 'status', 'orders', 'revenue')
+
+
+class DailyFoodStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyFoodStats
+        fields = ('date', 'status', 'food', 'category', 'size', 'orders', 'quantity', 'revenue')
@@ -1,7 +1,74 @@
-from django.dispatch import receiver
-from django.db.models.signals import post_save
+import threading
+from contextlib import contextmanager
+from functools import partial
 
-from core.models import OrderingFood
+from django.db import transaction
+from django.dispatch import receiver, Signal
+from django.utils import timezone
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, post_migrate
+
+from core.cache import bump_menu_version
+from core.models import Order, OrderingFood, SizeForSale, Category, Food, Size, FoodMakeup, FoodWeight
+from core.pubsub import publish_order_event
+from core.search import get_food_index
+from core.stats import (apply_sales_stats_delta, get_order_sales_stats, move_sales_stats, remember_sales_stats,
+                        update_sales_stats)
+from utils.images import image_processed
+
+MENU_MODELS = (Category, Food, Size, FoodMakeup, FoodWeight)
+
+# Sent with order_id, status, previous_status, version and created_at inside the transaction that moved the
+# order, see transition_order().
+order_status_changed = Signal()
+
+_state = threading.local()
+
+
+def menu_signals_muted():
+    return getattr(_state, 'muted', 0) > 0
+
+
+@contextmanager
+def bulk_menu_changes(using='default', chunk_size=1000):
+    """
+    Mutes the per-row catalog receivers below for bulk writes. Ids of the foods the
+    caller added to the yielded set get their updated_at, search index and the
+    menu version refreshed once on exit. Blocks may be nested.
+    """
+    food_ids = set()
+    _state.muted = getattr(_state, 'muted', 0) + 1
+    try:
+        yield food_ids
+    finally:
+        _state.muted -= 1
+
+    food_ids = list(food_ids)
+    index = get_food_index(using)
+    for start in range(0, len(food_ids), chunk_size):
+        chunk = food_ids[start:start + chunk_size]
+        Food.objects.using(using).filter(id__in=chunk).update(updated_at=timezone.now())
+        if index is not None:
+            index.update(chunk)
+    transaction.on_commit(bump_menu_version, using=using)
+
+
+def transition_order(pk, status, version=None):
+    """
+    Moves the order with Order.objects.transition() and sends order_status_changed
+    in the same transaction. Returns the previous status, None when the order did
+    not move, and the order's id, status, version and created_at after the attempt,
+    None when it does not exist.
+    """
+    with transaction.atomic():
+        previous_status = Order.objects.transition(pk, status, version)
+        # The UPDATE keeps the row locked until commit, so this read sees exactly that write.
+        current = Order.objects.filter(pk=pk).values('id', 'status', 'version', 'created_at').first()
+        if previous_status is not None:
+            order_status_changed.send(sender=Order, order_id=current['id'], status=current['status'],
+                                      previous_status=previous_status, version=current['version'],
+                                      created_at=current['created_at'])
+    return previous_status, current
 
 
 # @receiver(post_save, sender=OrderingFood)
@@ -9,4 +76,134 @@ from core.models import OrderingFood
 #     if created:
 #         food = instance.food
 #         instance.price = product.price
-#         instance.save()
\ No newline at end of file
+#         instance.save()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def menu_post_change(sender, **kwargs):
+    if sender in MENU_MODELS and not menu_signals_muted():
+        transaction.on_commit(bump_menu_version)
+
+
+@receiver(image_processed)
+def menu_image_processed(sender, **kwargs):
+    if sender in MENU_MODELS:
+        bump_menu_version()
+
+
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+@receiver(post_save, sender=FoodMakeup)
+@receiver(post_delete, sender=FoodMakeup)
+@receiver(post_save, sender=FoodWeight)
+@receiver(post_delete, sender=FoodWeight)
+def food_part_post_change(sender, instance, **kwargs):
+    if menu_signals_muted():
+        return
+    # Nested parts are rendered with the food, so its updated_at has to move with them.
+    Food.objects.filter(id=instance.food_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Category)
+def category_post_save(sender, instance: Category, created, **kwargs):
+    if not created and not menu_signals_muted():
+        Food.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_migrate)
+def create_food_search_index(sender, using, **kwargs):
+    if sender.name == 'core':
+        get_food_index(using, create=True)
+
+
+@receiver(post_save, sender=Food)
+def food_search_post_save(sender, instance: Food, using, **kwargs):
+    if menu_signals_muted():
+        return
+    index = get_food_index(using)
+    if index is not None:
+        index.update([instance.id])
+
+
+@receiver(post_delete, sender=Food)
+def food_search_post_delete(sender, instance: Food, using, **kwargs):
+    if menu_signals_muted():
+        return
+    index = get_food_index(using)
+    if index is not None:
+        index.delete([instance.id])
+
+
+@receiver(post_save, sender=FoodMakeup)
+@receiver(post_delete, sender=FoodMakeup)
+def food_makeup_search_post_change(sender, instance: FoodMakeup, using, **kwargs):
+    if menu_signals_muted():
+        return
+    index = get_food_index(using)
+    if index is not None:
+        index.update([instance.food_id])
+
+
+def _get_stats_order_ids(instance):
+    if isinstance(instance, Order):
+        return {instance.pk}
+    if isinstance(instance, OrderingFood):
+        rows = OrderingFood.objects.filter(pk=instance.pk) if instance.pk else OrderingFood.objects.none()
+        return {instance.order_id, *rows.values_list('order_id', flat=True)}
+    # A line moved to another order changes the stats of both.
+    q = Q(pk=instance.ordering_food_id)
+    if instance.pk:
+        q |= Q(sizes_for_sale=instance.pk)
+    return set(OrderingFood.objects.filter(q).values_list('order_id', flat=True))
+
+
+def _get_stats_tracker(instance, origin=None):
+    # Deletes track on their origin, so an order deleted with its lines is counted once.
+    holder = instance if origin is None else origin
+    return holder.__dict__.setdefault('_sales_stats', {})
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=OrderingFood)
+@receiver(pre_save, sender=SizeForSale)
+@receiver(pre_delete, sender=Order)
+@receiver(pre_delete, sender=OrderingFood)
+@receiver(pre_delete, sender=SizeForSale)
+def sales_stats_pre_change(sender, instance, raw=False, update_fields=None, origin=None, **kwargs):
+    if raw or instance._state.adding and sender is Order:
+        return
+    if sender is Order and update_fields is not None and not {'status', 'created_at'} & set(update_fields):
+        return
+    instance._sales_stats_orders = _get_stats_order_ids(instance)
+    remember_sales_stats(_get_stats_tracker(instance, origin), instance._sales_stats_orders)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=OrderingFood)
+@receiver(post_save, sender=SizeForSale)
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=OrderingFood)
+@receiver(post_delete, sender=SizeForSale)
+def sales_stats_post_change(sender, instance, created=False, raw=False, origin=None, **kwargs):
+    if raw:
+        return
+    if sender is Order and created:
+        apply_sales_stats_delta(({}, {}), get_order_sales_stats(instance.pk))
+        return
+    update_sales_stats(_get_stats_tracker(instance, origin), instance.__dict__.pop('_sales_stats_orders', ()))
+
+
+@receiver(order_status_changed)
+def order_status_stats_changed(sender, order_id, previous_status, **kwargs):
+    move_sales_stats(order_id, previous_status)
+
+
+@receiver(post_save, sender=Order)
+def order_events_post_save(sender, instance: Order, using, **kwargs):
+    transaction.on_commit(partial(publish_order_event, instance.id, instance.status, instance.version), using=using)
+
+
+@receiver(order_status_changed)
+def order_events_status_changed(sender, order_id, status, version, **kwargs):
+    transaction.on_commit(partial(publish_order_event, order_id, status, version))
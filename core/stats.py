@@ -0,0 +1,183 @@
+from contextlib import contextmanager
+from functools import partial
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from core.managers import PRICE_FIELD
+from core.models import Order, SizeForSale, DailyOrderStats, DailyFoodStats
+
+ORDER_STATS_KEY = ('date', 'status')
+FOOD_STATS_KEY = ('date', 'status', 'food_id', 'category_id', 'size_id')
+
+
+def _days_filter(days, field):
+    q = Q()
+    for day in days:
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        q |= Q(**{f'{field}__gte': start, f'{field}__lt': start + timedelta(days=1)})
+    return q
+
+
+def collect_sales_stats(orders, lines):
+    """
+    Groups orders and their size lines into rollup values, returned as
+    ({(date, status): values}, {(date, status, food_id, category_id, size_id): values}).
+    Revenue uses current size prices, like Order.total_price does.
+    """
+    food_stats = {}
+    order_stats = {}
+    food_rows = (
+        lines.order_by()
+        .values(
+            'size_id',
+            date=TruncDate('ordering_food__order__created_at'),
+            status=F('ordering_food__order__status'),
+            food_id=F('ordering_food__food_id'),
+            category_id=F('ordering_food__food__category_id'),
+        )
+        .annotate(
+            orders=Count('ordering_food__order_id', distinct=True),
+            total_quantity=Sum('quantity'),
+            revenue=Sum(F('size__price') * F('quantity'), output_field=PRICE_FIELD),
+        )
+    )
+    for row in food_rows:
+        food_stats[tuple(row[name] for name in FOOD_STATS_KEY)] = {
+            'orders': row['orders'], 'quantity': row['total_quantity'], 'revenue': row['revenue'],
+        }
+    order_rows = (
+        orders.order_by().annotate(date=TruncDate('created_at')).values('date', 'status').annotate(orders=Count('id'))
+    )
+    for row in order_rows:
+        order_stats[(row['date'], row['status'])] = {'orders': row['orders'], 'revenue': 0}
+    for key, values in food_stats.items():
+        order_stats[key[:2]]['revenue'] += values['revenue']
+    return order_stats, food_stats
+
+
+def get_order_sales_stats(order_id):
+    return collect_sales_stats(Order.objects.filter(pk=order_id),
+                               SizeForSale.objects.filter(ordering_food__order=order_id))
+
+
+def _add_to_row(model, key, delta):
+    changes = {
+        name: Greatest(F(name) + value, Value(0), output_field=model._meta.get_field(name))
+        for name, value in delta.items()
+    }
+    if model.objects.filter(**key).update(**changes, updated_at=timezone.now()):
+        if delta['orders'] < 0:
+            model.objects.filter(**key, orders=0).delete()
+        return
+    if delta['orders'] <= 0:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **{name: max(value, 0) for name, value in delta.items()})
+    except IntegrityError:
+        # Another transaction created the row first.
+        model.objects.filter(**key).update(**changes, updated_at=timezone.now())
+
+
+def _write_sales_stats(changes):
+    # One short transaction after the order's own, taking the rows in sorted order, so writers neither hold
+    # rollup rows while checking out nor lock them in different orders.
+    with transaction.atomic():
+        for model, key, delta in changes:
+            _add_to_row(model, key, delta)
+
+
+def apply_sales_stats_delta(before, after):
+    """
+    Adds the difference between two collect_sales_stats() results to the rollup
+    rows with F() updates once the current transaction commits, creating rows that
+    are missing and dropping rows without orders.
+    """
+    changes = []
+    for model, key_fields, old, new in ((DailyOrderStats, ORDER_STATS_KEY, before[0], after[0]),
+                                        (DailyFoodStats, FOOD_STATS_KEY, before[1], after[1])):
+        for key in sorted(old.keys() | new.keys()):
+            old_values, new_values = old.get(key, {}), new.get(key, {})
+            delta = {name: new_values.get(name, 0) - old_values.get(name, 0)
+                     for name in (old_values or new_values)}
+            if any(delta.values()):
+                changes.append((model, dict(zip(key_fields, key)), delta))
+    if changes:
+        transaction.on_commit(partial(_write_sales_stats, changes))
+
+
+def remember_sales_stats(tracked, order_ids):
+    """
+    Stores the current contribution of the orders to the rollups in `tracked`,
+    keeping what is already there.
+    """
+    for order_id in order_ids:
+        if order_id is not None and order_id not in tracked:
+            tracked[order_id] = get_order_sales_stats(order_id)
+
+
+def update_sales_stats(tracked, order_ids):
+    """
+    Applies the change of the orders' contribution since remember_sales_stats()
+    or the previous call, so repeated calls within one operation add up to the
+    total change exactly once.
+    """
+    for order_id in order_ids:
+        if order_id in tracked:
+            after = get_order_sales_stats(order_id)
+            apply_sales_stats_delta(tracked[order_id], after)
+            tracked[order_id] = after
+
+
+@contextmanager
+def track_sales_stats(order_ids):
+    """
+    Updates the rollups of the orders for changes made inside the block, e.g. with
+    bulk queries that send no signals.
+    """
+    tracked = {}
+    remember_sales_stats(tracked, order_ids)
+    yield
+    update_sales_stats(tracked, order_ids)
+
+
+def move_sales_stats(order_id, previous_status):
+    """Moves the contribution of an order from its previous status to its current one."""
+    after = get_order_sales_stats(order_id)
+    before = tuple({(key[0], previous_status) + key[2:]: values for key, values in stats.items()} for stats in after)
+    apply_sales_stats_delta(before, after)
+
+
+def refresh_sales_stats(days=None):
+    """
+    Recomputes the daily rollups of `days` (all of them when None) from orders and
+    their lines with grouped queries. Writes keep the rollups up to date with
+    deltas; this is for rebuilding them, e.g. after size prices changed.
+    """
+    orders = Order.objects.all()
+    lines = SizeForSale.objects.all()
+    order_stats = DailyOrderStats.objects.all()
+    food_stats = DailyFoodStats.objects.all()
+    if days is not None:
+        days = set(days)
+        if not days:
+            return
+        orders = orders.filter(_days_filter(days, 'created_at'))
+        lines = lines.filter(_days_filter(days, 'ordering_food__order__created_at'))
+        order_stats = order_stats.filter(date__in=days)
+        food_stats = food_stats.filter(date__in=days)
+
+    order_rows, food_rows = collect_sales_stats(orders, lines)
+    with transaction.atomic():
+        order_stats.delete()
+        food_stats.delete()
+        DailyOrderStats.objects.bulk_create([
+            DailyOrderStats(**dict(zip(ORDER_STATS_KEY, key)), **values) for key, values in order_rows.items()
+        ])
+        DailyFoodStats.objects.bulk_create([
+            DailyFoodStats(**dict(zip(FOOD_STATS_KEY, key)), **values) for key, values in food_rows.items()
+        ], batch_size=1000)
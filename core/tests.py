@@ -0,0 +1,467 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from account.models import User
+from core.cache import get_menu_cache
+from core.menu import MenuSnapshot
+from core.menu_io import import_records
+from core.models import (Category, Food, Size, FoodMakeup, FoodWeight, Order, OrderingFood, SizeForSale,
+                         DailyOrderStats, DailyFoodStats)
+from core.search import get_food_index
+from core.serializers import ReadFoodSerializer, OrderSerializer
+from core.signals import bulk_menu_changes, menu_signals_muted
+from core.views import FoodViewSet, OrderViewSet
+from utils.db import PrimaryReplicaRouter, read_from_primary
+from utils.images import image_queue, IMAGE_PENDING
+from utils.sqlite.base import DatabaseWrapper as TunedSQLiteWrapper
+from utils.values import compile_values_plan
+from utils.views import serve, MEDIA_HASHED_NAME_RE, STATIC_HASHED_NAME_RE
+
+
+def create_menu(count, categories=2):
+    categories = [Category.objects.create(name=f'Категория {index}') for index in range(categories)]
+    foods = []
+    for index in range(count):
+        food = Food.objects.create(name=f'Блюдо {index}', description=f'Описание {index}',
+                                   category=categories[index % len(categories)], image='food_images/food.webp')
+        Size.objects.create(name='S', price=Decimal('10.50'), food=food)
+        Size.objects.create(name='L', price=Decimal('20.00'), food=food)
+        FoodMakeup.objects.create(name='сыр', food=food)
+        FoodWeight.objects.create(value=Decimal('0.300'), food=food)
+        foods.append(food)
+    return foods
+
+
+def create_orders(foods, count, lines=3):
+    orders = []
+    for index in range(count):
+        order = Order.objects.create(name=f'Клиент {index}', email='client@example.com', phone='+996555123456',
+                                     address='ул. Киевская', home='1')
+        for food in foods[:lines]:
+            ordering_food = OrderingFood.objects.create(order=order, food=food)
+            for size in food.sizes.all():
+                SizeForSale.objects.create(size=size, quantity=2, ordering_food=ordering_food)
+        orders.append(order)
+    return orders
+
+
+class MenuTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_menu_cache().clear()
+
+
+class FoodListQueriesTest(MenuTestCase):
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        create_menu(100)
+        for page_size in (10, 100):
+            get_menu_cache().clear()
+            with self.subTest(page_size=page_size), self.assertNumQueries(6):
+                response = self.client.get('/api/v1/food/', {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), page_size)
+
+    def test_retrieve_query_count(self):
+        food = create_menu(3)[0]
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/v1/food/{food.id}/')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(MENU_CACHE_TIMEOUT=0)
+class FastListTest(MenuTestCase):
+    urls = [
+        '/api/v1/food/',
+        '/api/v1/food/?page_size=3&page=2',
+        '/api/v1/food/?search=блюдо',
+        '/api/v1/food/?ordering=name',
+        '/api/v1/food/?fields=id,name,category.name',
+        '/api/v1/food/?expand=',
+        '/api/v1/food/?fields=id,image_variants',
+        '/api/v1/food/?fields=,',
+        '/api/v1/orders/',
+        '/api/v1/orders/?pagination=cursor&page_size=2',
+        '/api/v1/orders/?search=Клиент',
+        '/api/v1/orders/?fields=id,phone,total_price',
+        '/api/v1/orders/?expand=ordering_food',
+        '/api/v1/orders/?expand=',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        foods = create_menu(6)
+        Food.objects.filter(pk=foods[0].pk).update(image='')
+        Food.objects.filter(pk=foods[1].pk).update(image_variants={
+            'thumbnail': ['variants/ab/ab-160w.webp', 160], 'card': ['variants/ab/ab-300w.webp', 300],
+            'detail': ['variants/ab/ab-300w.webp', 300],
+        })
+        create_orders(foods, 4)
+
+    def test_fast_path_renders_the_same_bytes_as_serializers(self):
+        self.assertIsNotNone(compile_values_plan(ReadFoodSerializer(many=True)))
+        self.assertIsNotNone(compile_values_plan(OrderSerializer(many=True)))
+        for url in self.urls:
+            with self.subTest(url=url):
+                fast = self.client.get(url)
+                with mock.patch.object(FoodViewSet, 'fast_list', False), \
+                        mock.patch.object(OrderViewSet, 'fast_list', False):
+                    slow = self.client.get(url)
+                self.assertEqual(fast.status_code, 200)
+                data = fast.json()
+                self.assertTrue(data['results'] if isinstance(data, dict) else data)
+                self.assertEqual(fast.content, slow.content)
+
+    def test_unknown_fields_are_rejected(self):
+        for url, errors in [
+            ('/api/v1/food/?fields=nope,other', ['unknown field nope', 'unknown field other']),
+            ('/api/v1/food/?fields=id,category.nope', ['unknown field category.nope']),
+            ('/api/v1/orders/?fields=id,nope', ['unknown field nope']),
+        ]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'fields': errors})
+
+
+class BatchFoodTest(MenuTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Пицца')
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='admin'))
+
+    def post_batch(self, category, count=10):
+        payload = [
+            {'name': f'Блюдо {index}', 'description': 'Описание', 'category': category,
+             'sizes': [{'name': 'S', 'price': '10.50'}], 'makeups': [{'name': 'сыр'}]}
+            for index in range(count)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/food/batch/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def test_string_category_ids_are_prefetched(self):
+        self.assertEqual(self.post_batch(str(self.category.pk)), self.post_batch(self.category.pk))
+        self.assertEqual(Food.objects.filter(category=self.category).count(), 20)
+
+    def test_unknown_category_is_rejected(self):
+        response = self.client.post('/api/v1/food/batch/', [{'name': 'x', 'description': 'y', 'category': 'abc'}],
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class DestroyTest(MenuTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='admin'))
+
+    def test_destroy_food(self):
+        food = create_menu(1)[0]
+        response = self.client.delete(f'/api/v1/food/{food.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Food.objects.exists())
+
+    def test_destroy_order(self):
+        order = create_orders(create_menu(2), 1)[0]
+        response = self.client.delete(f'/api/v1/orders/{order.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Order.objects.exists())
+
+
+class SalesStatsTest(MenuTestCase):
+
+    def test_rollups_are_written_after_commit(self):
+        food = create_menu(1)[0]
+        size = food.sizes.get(name='S')
+        payload = {'name': 'Клиент', 'email': 'client@example.com', 'phone': '+996555123456',
+                   'address': 'ул. Киевская', 'home': '1',
+                   'ordering_food': [{'food': food.id, 'sizes_for_sale': [{'size': size.id, 'quantity': 2}]}]}
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/v1/orders/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertFalse(DailyOrderStats.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        stats = DailyOrderStats.objects.get()
+        self.assertEqual((stats.status, stats.orders, stats.revenue), (Order.WAITING, 1, Decimal('21.00')))
+        self.assertEqual(DailyFoodStats.objects.get().quantity, 2)
+
+
+class MenuSnapshotTest(MenuTestCase):
+
+    def test_weak_etag_and_absolute_urls_per_host(self):
+        create_menu(2)
+        snapshot = MenuSnapshot()
+        build = snapshot.get(RequestFactory().get('/api/v1/menu/'))
+        self.assertTrue(build.etag.startswith('W/"'))
+        self.assertIn(b'"http://testserver/media/food_images/food.webp"', build.content['identity'])
+
+        other = snapshot.get(RequestFactory().get('/api/v1/menu/', HTTP_HOST='menu.example.com'))
+        self.assertIn(b'"http://menu.example.com/media/food_images/food.webp"', other.content['identity'])
+        self.assertIs(snapshot.get(RequestFactory().get('/api/v1/menu/')), build)
+
+    def test_builds_are_kept_for_a_few_hosts(self):
+        create_menu(1)
+        snapshot = MenuSnapshot()
+        for index in range(snapshot.max_hosts * 3):
+            snapshot.get(RequestFactory().get('/api/v1/menu/', HTTP_HOST=f'host{index}.example.com'))
+        self.assertEqual(len(snapshot._builds), snapshot.max_hosts)
+
+    def test_not_modified(self):
+        create_menu(2)
+        etag = self.client.get('/api/v1/menu/', HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        self.assertEqual(self.client.get('/api/v1/menu/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class MenuImportTest(MenuTestCase):
+
+    def test_nested_bulk_changes_stay_muted(self):
+        with bulk_menu_changes():
+            with bulk_menu_changes():
+                self.assertTrue(menu_signals_muted())
+            self.assertTrue(menu_signals_muted())
+        self.assertFalse(menu_signals_muted())
+
+    def test_last_record_of_a_food_in_a_chunk_wins(self):
+        records = [
+            {'category': 'Пицца', 'name': 'Маргарита', 'description': 'старое', 'sizes': [{'name': 'S', 'price': 10}]},
+            {'category': 'Пицца', 'name': 'Маргарита', 'description': 'новое', 'sizes': [{'name': 'S', 'price': 12}],
+             'makeups': ['сыр']},
+        ]
+        list(import_records(records))
+        food = Food.objects.get()
+        self.assertEqual(food.description, 'новое')
+        self.assertEqual([(size.name, size.price) for size in food.sizes.all()], [('S', Decimal('12.00'))])
+        self.assertEqual(food.makeups.count(), 1)
+
+    def test_image_is_kept_unless_given_and_reset_when_changed(self):
+        food = create_menu(1)[0]
+        variants = {'card': ['variants/ab/ab-480w.webp', 480]}
+        Food.objects.filter(pk=food.pk).update(image_variants=variants)
+        record = {'category': food.category.name, 'name': food.name, 'description': 'новое'}
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            list(import_records([record]))
+        food.refresh_from_db()
+        self.assertEqual((food.image.name, food.image_variants, food.description),
+                         ('food_images/food.webp', variants, 'новое'))
+        self.assertEqual(len([c for c in callbacks if getattr(c, 'func', None) == image_queue.submit]), 0)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            list(import_records([{**record, 'image': 'food_images/other.webp'}]))
+        food.refresh_from_db()
+        self.assertEqual((food.image.name, food.image_status, food.image_variants),
+                         ('food_images/other.webp', IMAGE_PENDING, {}))
+        self.assertEqual(len([c for c in callbacks if getattr(c, 'func', None) == image_queue.submit]), 1)
+
+    def test_record_without_category_is_rejected(self):
+        records = [{'category': 'Пицца', 'name': 'Маргарита'}, {'name': 'Без категории'}]
+        with self.assertRaisesMessage(ValidationError, 'Record 2: "category" is required'):
+            list(import_records(records))
+        self.assertFalse(Food.objects.exists())
+
+
+class FoodIndexTest(TestCase):
+
+    def test_missing_index_is_checked_again(self):
+        with mock.patch.object(connection, 'food_search_ready', None, create=True):
+            with mock.patch.object(connection.introspection, 'table_names', return_value=[]):
+                self.assertIsNone(get_food_index())
+            self.assertIsNotNone(get_food_index())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL full-text search')
+@override_settings(MENU_CACHE_TIMEOUT=0)
+class PostgresFoodSearchTest(MenuTestCase):
+
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Пицца')
+        self.pizza = Food.objects.create(name='Пицца Маргарита', description='Томаты', category=category)
+        self.soup = Food.objects.create(name='Суп', description='Почти пицца', category=category)
+        FoodMakeup.objects.create(name='сыр', food=self.soup)
+
+    def search(self, term):
+        data = self.client.get('/api/v1/food/', {'search': term}).json()
+        return [food['name'] for food in (data['results'] if isinstance(data, dict) else data)]
+
+    def test_index_stores_tsvectors(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = 'core_food_search' AND column_name = 'document'"
+            )
+            self.assertEqual(cursor.fetchone(), ('tsvector',))
+
+    def test_search_ranks_names_first_and_matches_prefixes(self):
+        self.assertEqual(self.search('пиц'), ['Пицца Маргарита', 'Суп'])
+        self.assertEqual(self.search('сы'), ['Суп'])
+        self.assertEqual(self.search('пицца томаты'), ['Пицца Маргарита'])
+
+    def test_reindexing_upserts_documents(self):
+        index = get_food_index()
+        index.update([self.pizza.pk, self.soup.pk])
+        index.update([self.pizza.pk])
+        self.pizza.name = 'Лазанья'
+        self.pizza.save()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM core_food_search')
+            self.assertEqual(cursor.fetchone(), (2,))
+        self.assertEqual(self.search('лаз'), ['Лазанья'])
+        self.assertEqual(self.search('пиц'), ['Суп'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite transaction mode')
+class TunedSQLiteTest(SimpleTestCase):
+
+    def test_transactions_begin_immediate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'tuned.sqlite3')
+            tuned = TunedSQLiteWrapper({
+                **connection.settings_dict, 'NAME': name,
+                'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'init_command': 'PRAGMA journal_mode=WAL'},
+            }, alias='tuned')
+            other = TunedSQLiteWrapper({**connection.settings_dict, 'NAME': name, 'OPTIONS': {'timeout': 0}},
+                                       alias='other')
+            try:
+                with tuned.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone(), ('wal',))
+                    cursor.execute('CREATE TABLE t (id integer)')
+                # The write lock is taken by BEGIN already, not by the first write.
+                tuned._start_transaction_under_autocommit()
+                with self.assertRaisesMessage(Exception, 'database is locked'):
+                    with other.cursor() as cursor:
+                        cursor.execute('INSERT INTO t VALUES (1)')
+                tuned.connection.rollback()
+            finally:
+                tuned.close()
+                other.close()
+
+
+@mock.patch('utils.db.get_replica_aliases', return_value=['replica1'])
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    router = PrimaryReplicaRouter()
+
+    def test_reads_replica_models_from_a_replica(self, replicas):
+        self.assertEqual(self.router.db_for_read(Food), 'replica1')
+
+    def test_reads_from_primary_when_asked(self, replicas):
+        with read_from_primary():
+            self.assertEqual(self.router.db_for_read(Food), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Food), 'replica1')
+
+    def test_reads_other_models_from_primary(self, replicas):
+        self.assertEqual(self.router.db_for_read(Order), DEFAULT_DB_ALIAS)
+
+    def test_reads_relations_from_the_instance_database(self, replicas):
+        food = Food()
+        food._state.db = DEFAULT_DB_ALIAS
+        self.assertEqual(self.router.db_for_read(Category, instance=food), DEFAULT_DB_ALIAS)
+
+    def test_reads_from_primary_without_replicas(self, replicas):
+        replicas.return_value = []
+        self.assertEqual(self.router.db_for_read(Food), DEFAULT_DB_ALIAS)
+
+    def test_writes_go_to_primary(self, replicas):
+        self.assertEqual(self.router.db_for_write(Food), DEFAULT_DB_ALIAS)
+        with read_from_primary():
+            self.assertEqual(self.router.db_for_write(Food), DEFAULT_DB_ALIAS)
+
+
+@mock.patch('utils.db.get_replica_aliases', return_value=['replica1'])
+class PrimaryReplicaRouterTransactionTest(TestCase):
+
+    def test_reads_from_primary_inside_transactions(self, replicas):
+        self.assertEqual(PrimaryReplicaRouter().db_for_read(Food), DEFAULT_DB_ALIAS)
+
+
+class DatabaseSettingsTest(SimpleTestCase):
+
+    def get_databases(self, **env):
+        env = {
+            'PATH': os.environ.get('PATH', ''), 'SECRET_KEY': 'x', 'DEBUG': 'false', 'ALLOWED_HOSTS': '["*"]', **env,
+        }
+        output = subprocess.run(
+            [sys.executable, '-c', 'import json, project.settings as s; print(json.dumps(s.DATABASES, default=str))'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        return json.loads(output)
+
+    def test_sqlite(self):
+        databases = self.get_databases()
+        self.assertEqual(list(databases), ['default'])
+        self.assertEqual(databases['default']['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(databases['default']['NAME'], str(settings.BASE_DIR / 'db.sqlite3'))
+
+    def test_sqlite_tuning(self):
+        databases = self.get_databases(SQLITE_TUNING='true', SQLITE_BUSY_TIMEOUT='5')
+        self.assertEqual(databases['default']['ENGINE'], 'utils.sqlite')
+        self.assertEqual(databases['default']['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertEqual(databases['default']['OPTIONS']['timeout'], 5)
+
+    def test_postgresql_with_replicas(self):
+        databases = self.get_databases(
+            DB_ENGINE='django.db.backends.postgresql', DB_NAME='food', DB_USER='food', DB_PASSWORD='secret',
+            DB_HOST='primary', DB_PORT='5432', DB_CONN_MAX_AGE='60', DB_REPLICA_HOSTS='replica-a:6432,replica-b',
+            SQLITE_TUNING='true',
+        )
+        self.assertEqual(list(databases), ['default', 'replica1', 'replica2'])
+        self.assertEqual(databases['default']['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(databases['default']['NAME'], 'food')
+        self.assertEqual(databases['default']['CONN_MAX_AGE'], 60)
+        self.assertNotIn('OPTIONS', databases['default'])
+        self.assertEqual(
+            {alias: (database['HOST'], database['PORT'], database['USER'], database['TEST'])
+             for alias, database in databases.items() if alias != 'default'},
+            {'replica1': ('replica-a', '6432', 'food', {'MIRROR': 'default'}),
+             'replica2': ('replica-b', '5432', 'food', {'MIRROR': 'default'})},
+        )
+
+
+class ServeCacheControlTest(SimpleTestCase):
+
+    def get_cache_control(self, path, hashed_name_re):
+        with tempfile.TemporaryDirectory() as root:
+            fullpath = os.path.join(root, path)
+            os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+            with open(fullpath, 'wb') as f:
+                f.write(b'x')
+            response = serve(RequestFactory().get('/'), path, root, hashed_name_re=hashed_name_re)
+            response.close()
+            return response['Cache-Control']
+
+    def test_only_storage_hashed_names_are_immutable(self):
+        immutable = [
+            ('css/app.3f2a1b4c5d6e.css', STATIC_HASHED_NAME_RE),
+            ('variants/ab/ab' + '0' * 30 + '-320w.webp', MEDIA_HASHED_NAME_RE),
+        ]
+        mutable = [
+            ('css/app.css', STATIC_HASHED_NAME_RE),
+            ('food/photo_202610181230.jpg', MEDIA_HASHED_NAME_RE),
+            ('food/1697612345678.png', MEDIA_HASHED_NAME_RE),
+            ('food/photo.3f2a1b4c5d6e.jpg', MEDIA_HASHED_NAME_RE),
+            ('food/photo.3f2a1b4c5d6e.jpg', None),
+        ]
+        for path, hashed_name_re in immutable:
+            self.assertIn('immutable', self.get_cache_control(path, hashed_name_re), path)
+        for path, hashed_name_re in mutable:
+            self.assertNotIn('immutable', self.get_cache_control(path, hashed_name_re), path)
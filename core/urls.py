@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 
 from . import views
@@ -13,10 +14,23 @@ router.register('food-makeup', views.FoodMakeupViewSet)
 router.register('food-weight', views.FoodWeightViewSet)
 router.register('orders', views.OrderViewSet)
 router.register('order-food', views.OrderingFoodViewSet)
+router.register('sales-stats/orders', views.DailyOrderStatsViewSet)
+router.register('sales-stats/food', views.DailyFoodStatsViewSet)
 
 
 urlpatterns = [
+    path('menu/', views.MenuView.as_view(), name='menu'),
+    path('menu-cache/stats/', views.MenuCacheStatsView.as_view(), name='menu-cache-stats'),
+    path('orders/<int:id>/events/', views.OrderEventsView.as_view(), name='order-events'),
     path('', include(router.urls))
 ]
 
+if settings.ASYNC_CATALOG_VIEWS:
+    urlpatterns = [
+        path('categories/', views.AsyncCatalogView.as_view(views.CategoryViewSet)),
+        path('categories/<int:id>/', views.AsyncCatalogView.as_view(views.CategoryViewSet, detail=True)),
+        path('food/', views.AsyncCatalogView.as_view(views.FoodViewSet)),
+        path('food/<int:id>/', views.AsyncCatalogView.as_view(views.FoodViewSet, detail=True)),
+    ] + urlpatterns
+
 urlpatterns += url_doc
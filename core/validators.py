@@ -0,0 +1,20 @@
+from django.core.exceptions import ValidationError
+
+from core.models import Size
+
+
+def validate_food_sizes(pairs):
+    """
+    Checks that every (food_id, size_id) pair refers to a size of that food,
+    using a single query for all pairs.
+    """
+    pairs = {(food_id, size_id) for food_id, size_id in pairs if food_id is not None and size_id is not None}
+    if not pairs:
+        return
+
+    valid_pairs = set(Size.objects.filter(
+        id__in={size_id for _, size_id in pairs},
+        food_id__in={food_id for food_id, _ in pairs},
+    ).values_list('food_id', 'id'))
+    if pairs - valid_pairs:
+        raise ValidationError(message='the food does not include this size', code='invalid_size')
@@ -1,38 +1,71 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse, Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django_filters.rest_framework import DjangoFilterBackend
 
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
-from rest_framework import filters
+from rest_framework import filters, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from core.cache import get_menu_cache, get_menu_cache_key, get_menu_cache_stats, record_menu_cache_hit
 from core.filters import FoodFilter
-from core.models import Category, Food, Size, FoodMakeup, FoodWeight, OrderingFood, Order
-from core.paginations import SimpleResultPagination
+from core.menu import menu_snapshot
+from core.models import (Category, Food, Size, FoodMakeup, FoodWeight, OrderingFood, Order,
+                         DailyOrderStats, DailyFoodStats)
+from core.paginations import SimpleResultPagination, AsyncPageNumberPagination, CreatedAtCursorPagination
+from core.pubsub import get_broker, get_order_channel
+from core.renderers import ORJSONRenderer
+from core.search import FoodSearchFilter
+from core.signals import transition_order
 from core.serializers import (CategorySerializer, FoodSerializer, CreateFoodSerializer, ReadFoodSerializer,
                               FoodMakeupSerializer, FoodSizeSerializer, FoodWeightSerializer,
-                              OrderSerializer, OrderingFoodSerializer, CreateOrderSerializer)
+                              OrderSerializer, OrderingFoodSerializer, CreateOrderSerializer, BatchFoodSerializer,
+                              DailyOrderStatsSerializer, DailyFoodStatsSerializer, OrderTransitionSerializer)
 from core.mixins import UltraModelViewSet
+from utils.querysets import optimize_queryset
+from utils.db import read_from_primary
+from utils.streaming import ndjson_lines, csv_lines
 
 
 class CategoryViewSet(UltraModelViewSet):
     queryset = Category.objects.all()
-    pagination_class = SimpleResultPagination
+    pagination_class = AsyncPageNumberPagination
     serializer_class = CategorySerializer
+    cache_actions = ('list', 'retrieve')
+    conditional_actions = ('list', 'retrieve')
     lookup_field = 'id'
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     search_fields = ['name']
+    ordering = ('name',)
     permission_classes = (AllowAny, )
 
 
 class FoodViewSet(UltraModelViewSet):
     queryset = Food.objects.all()
-    pagination_class = SimpleResultPagination
+    pagination_class = AsyncPageNumberPagination
     serializer_classes = {
         'list': ReadFoodSerializer,
         'update': FoodSerializer,
         'create': CreateFoodSerializer,
         'retrieve': ReadFoodSerializer,
+        'batch': BatchFoodSerializer,
     }
+    fast_list = True
+    cache_actions = ('list', 'retrieve')
+    conditional_actions = ('list', 'retrieve')
     lookup_field = 'id'
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
+    filter_backends = [FoodSearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     search_fields = ['name',]
     ordering_fields = ['name',]
     filterset_class = FoodFilter
@@ -42,17 +75,36 @@ class FoodViewSet(UltraModelViewSet):
         'create': (IsAuthenticated, IsAdminUser),
         'update': (IsAuthenticated, IsAdminUser,),
         'destroy': (IsAuthenticated, IsAdminUser,),
+        'batch': (IsAuthenticated, IsAdminUser,),
     }
 
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request, *args, **kwargs):
+        """
+        Creates and updates a list of foods with their makeups, sizes and weight.
+        Foods created from JSON have no image; upload it with PUT /food/<id>/.
+        """
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        foods = serializer.save()
+
+        saved = optimize_queryset(Food.objects.all(), ReadFoodSerializer()).in_bulk([food.id for food in foods])
+        read_serializer = ReadFoodSerializer([saved[food.id] for food in foods], many=True,
+                                             context=self.get_serializer_context())
+        return Response(read_serializer.data)
+
 
 class FoodSizeViewSet(UltraModelViewSet):
     queryset = Size.objects.all()
     serializer_class = FoodSizeSerializer
     pagination_class = SimpleResultPagination
+    cache_actions = ('list', 'retrieve')
+    conditional_actions = ('list', 'retrieve')
     lookup_field = 'id'
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     search_fields = ['name', 'price']
     filterset_fields = ['food']
+    ordering = ('food_id', 'price')
     permission_classes_by_action = {
         'list': (AllowAny,),
         'retrieve': (AllowAny,),
@@ -66,6 +118,8 @@ class FoodMakeupViewSet(UltraModelViewSet):
     queryset = FoodMakeup.objects.all()
     serializer_class = FoodMakeupSerializer
     pagination_class = SimpleResultPagination
+    cache_actions = ('list', 'retrieve')
+    conditional_actions = ('list', 'retrieve')
     lookup_field = 'id'
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     search_fields = ['name',]
@@ -77,6 +131,8 @@ class FoodWeightViewSet(UltraModelViewSet):
     queryset = FoodWeight.objects.all()
     serializer_class = FoodWeightSerializer
     pagination_class = SimpleResultPagination
+    cache_actions = ('list', 'retrieve')
+    conditional_actions = ('list', 'retrieve')
     lookup_field = 'id'
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     search_fields = ['value',]
@@ -91,35 +147,88 @@ class FoodWeightViewSet(UltraModelViewSet):
 
 
 class OrderViewSet(UltraModelViewSet):
-    queryset = Order.objects.all()
+    queryset = Order.objects.with_total_price()
     serializer_classes = {
         'list': OrderSerializer,
         'retrieve': OrderSerializer,
         'update': OrderSerializer,
         'create': CreateOrderSerializer,
+        'export': OrderSerializer,
+        'transition': OrderTransitionSerializer,
     }
     pagination_class = SimpleResultPagination
+    pagination_classes = {'cursor': CreatedAtCursorPagination}
+    fast_list = True
+    export_chunk_size = 500
     lookup_field = 'id'
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     ordering_fields = ['created_at']
+    ordering = ('-created_at', 'id')
     search_fields = ['name', 'email', 'phone', 'address', 'home']
-    filterset_fields = ['ordering_food__food']
+    filterset_fields = {
+        'ordering_food__food': ['exact'],
+        'status': ['exact'],
+        'created_at': ['gte', 'lt'],
+    }
     permission_classes_by_action = {
         'list': (AllowAny,),
         'retrieve': (AllowAny,),
         'create': (AllowAny,),
         'update': (AllowAny, AllowAny,),
         'destroy': (IsAuthenticated, IsAdminUser,),
+        'export': (IsAuthenticated, IsAdminUser,),
+        'transition': (IsAuthenticated, IsAdminUser,),
     }
 
+    @action(detail=True, methods=['post'], url_path='transition')
+    def transition(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            pk = Order._meta.pk.to_python(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except DjangoValidationError:
+            raise Http404
+        target = serializer.validated_data['status']
+        previous_status, current = transition_order(pk, target, serializer.validated_data.get('version'))
+        if current is None:
+            raise Http404
+        current.pop('created_at')
+
+        if previous_status is None:
+            if target in Order.ORDER_TRANSITIONS.get(current['status'], ()):
+                detail = 'Order was changed by someone else, reload it and try again.'
+            else:
+                detail = f'Order can not move from {current["status"]} to {target}.'
+            return Response({'detail': detail, **current}, status=status.HTTP_409_CONFLICT)
+        return Response(current)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request, *args, **kwargs):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            raise ValidationError({'export_format': ['Choose ndjson or csv.']})
+
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        # iterator() prefetches per chunk, so memory stays flat however many orders match.
+        rows = (serializer.to_representation(order) for order in queryset.iterator(chunk_size=self.export_chunk_size))
+        if export_format == 'csv':
+            response = StreamingHttpResponse(csv_lines(rows, list(serializer.fields)), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(ndjson_lines(rows, ORJSONRenderer()), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
+
 
 class OrderingFoodViewSet(UltraModelViewSet):
     queryset = OrderingFood.objects.all()
     serializer_class = OrderingFoodSerializer
     pagination_class = SimpleResultPagination
+    pagination_classes = {'cursor': CreatedAtCursorPagination}
     lookup_field = 'id'
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     ordering_fields = ['created_at', 'quantity']
+    ordering = ('-created_at', 'id')
     filterset_fields = ['food', 'order']
     permission_classes_by_action = {
         'list': (AllowAny,),
@@ -130,3 +239,223 @@ class OrderingFoodViewSet(UltraModelViewSet):
     }
 
 
+class DailyOrderStatsViewSet(ReadOnlyModelViewSet):
+    queryset = DailyOrderStats.objects.all()
+    serializer_class = DailyOrderStatsSerializer
+    pagination_class = SimpleResultPagination
+    filter_backends = [filters.OrderingFilter, DjangoFilterBackend]
+    ordering_fields = ['date', 'orders', 'revenue']
+    filterset_fields = {
+        'date': ['exact', 'gte', 'lte'],
+        'status': ['exact'],
+    }
+    permission_classes = (IsAuthenticated, IsAdminUser,)
+
+
+class DailyFoodStatsViewSet(ReadOnlyModelViewSet):
+    queryset = DailyFoodStats.objects.all()
+    serializer_class = DailyFoodStatsSerializer
+    pagination_class = SimpleResultPagination
+    filter_backends = [filters.OrderingFilter, DjangoFilterBackend]
+    ordering_fields = ['date', 'quantity', 'revenue']
+    filterset_fields = {
+        'date': ['exact', 'gte', 'lte'],
+        'status': ['exact'],
+        'food': ['exact'],
+        'category': ['exact'],
+        'size': ['exact'],
+    }
+    totals_group_by = ('date', 'status', 'food', 'category', 'size')
+    permission_classes = (IsAuthenticated, IsAdminUser,)
+
+    @action(detail=False, methods=['get'])
+    def totals(self, request, *args, **kwargs):
+        group_by = request.query_params.get('group_by', 'food')
+        if group_by not in self.totals_group_by:
+            raise ValidationError({'group_by': [f'Choose one of: {", ".join(self.totals_group_by)}.']})
+
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .order_by(group_by)
+            .values(group_by)
+            .annotate(total_quantity=Sum('quantity'), total_revenue=Sum('revenue'))
+        )
+        return Response(rows)
+
+
+class MenuCacheStatsView(APIView):
+    permission_classes = (IsAuthenticated, IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_menu_cache_stats())
+
+
+class MenuView(APIView):
+    permission_classes = (AllowAny,)
+
+    def get(self, request):
+        snapshot = menu_snapshot.get(request)
+        response = get_conditional_response(request, etag=snapshot.etag)
+        if response is not None:
+            return response
+
+        accepted = {value.split(';')[0].strip() for value in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')}
+        encoding = next((name for name in ('br', 'gzip') if name in accepted and name in snapshot.content), 'identity')
+        response = HttpResponse(snapshot.content[encoding], content_type='application/json')
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+        response['ETag'] = snapshot.etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class OrderEventsView(View):
+    """
+    Streams status changes of an order as Server-Sent Events, starting with its
+    current status and ending once it is delivered or canceled. Needs ASGI to
+    hold many connections open.
+    """
+
+    async def get(self, request, id):
+        if not await Order.objects.filter(id=id).aexists():
+            raise Http404
+        response = StreamingHttpResponse(self.stream(id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, order_id):
+        renderer = ORJSONRenderer()
+        async with get_broker().subscribe(get_order_channel(order_id)) as queue:
+            # Subscribed before reading, so a change in between is not lost.
+            message = await Order.objects.filter(id=order_id).values('id', 'status', 'version').afirst()
+            last = None
+            while message is not None:
+                if (message['status'], message['version']) != last:
+                    last = (message['status'], message['version'])
+                    yield b'event: status\nid: %d\ndata: %s\n\n' % (message['version'], renderer.render(message))
+                if message['status'] not in Order.ORDER_TRANSITIONS:
+                    return
+                while True:
+                    try:
+                        message = await asyncio.wait_for(queue.get(), settings.ORDER_EVENTS_KEEPALIVE)
+                        break
+                    except asyncio.TimeoutError:
+                        yield b': keepalive\n\n'
+
+
+class AsyncCatalogView(View):
+    """
+    Runs list/retrieve of a catalog viewset on the async ORM, so an ASGI worker
+    serves other requests while waiting on the database. Authentication, filters
+    and query planning still come from the viewset; other methods, and paginators
+    without `apaginate_queryset`, go to the regular sync view.
+    """
+    viewset_class = None
+    actions = None
+    sync_view = None
+
+    @classmethod
+    def as_view(cls, viewset_class, detail=False, **initkwargs):
+        if detail:
+            actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+        else:
+            actions = {'get': 'list', 'post': 'create'}
+        view = super().as_view(viewset_class=viewset_class, actions=actions,
+                               sync_view=viewset_class.as_view(actions), **initkwargs)
+        # The viewset checks CSRF itself for session-authenticated requests.
+        return csrf_exempt(view)
+
+    @property
+    def action(self):
+        return self.actions['get']
+
+    async def get(self, request, *args, **kwargs):
+        viewset = self.viewset_class(action_map={**self.actions, 'head': self.action})
+        for method, action in viewset.action_map.items():
+            setattr(viewset, method, getattr(viewset, action))
+        viewset.args, viewset.kwargs = args, kwargs
+        viewset.request = viewset.initialize_request(request, *args, **kwargs)
+        viewset.headers = viewset.default_response_headers
+        if self.action == 'list' and viewset.paginator is not None and \
+                not hasattr(viewset.paginator, 'apaginate_queryset'):
+            return await self.post(request, *args, **kwargs)
+
+        try:
+            response = await self.get_response(viewset)
+        except Exception as exc:
+            response = viewset.handle_exception(exc)
+        return viewset.finalize_response(viewset.request, response, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+    put = patch = delete = options = post
+
+    def prepare(self, viewset):
+        viewset.initial(viewset.request)
+        return viewset.filter_queryset(viewset.get_queryset()), viewset.get_conditional_queryset()
+
+    async def get_response(self, viewset):
+        request = viewset.request
+        queryset, conditional_queryset = await sync_to_async(self.prepare)(viewset)
+
+        etag = last_modified = None
+        if self.action in viewset.conditional_actions:
+            state = await conditional_queryset.aaggregate(**viewset.get_conditional_aggregates())
+            etag, last_modified = viewset.get_conditional_validators(request, state)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+
+        cache = key = None
+        if self.action in viewset.cache_actions:
+            cache = get_menu_cache()
+            key = await sync_to_async(get_menu_cache_key)(request)
+            data = await cache.aget(key)
+            await sync_to_async(record_menu_cache_hit)(data is not None)
+            if data is not None:
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                viewset.set_conditional_headers(response, etag, last_modified)
+                return response
+
+        if key is None:
+            response = await self.render(viewset, queryset)
+        else:
+            # What goes into the menu cache is read from the primary, see MenuCacheMixin.
+            with read_from_primary():
+                response = await self.render(viewset, queryset)
+            await cache.aset(key, response.data, viewset.get_cache_timeout())
+            response['X-Cache'] = 'MISS'
+        if etag is not None:
+            viewset.set_conditional_headers(response, etag, last_modified)
+        return response
+
+    @staticmethod
+    def serialize(viewset, instance, many=False):
+        return viewset.get_serializer(instance, many=many).data
+
+    async def render(self, viewset, queryset):
+        # Serializers may still touch the ORM, storages or caches, so they run off the event loop.
+        if self.action == 'retrieve':
+            obj = await self.get_object(viewset, queryset)
+            return Response(await sync_to_async(self.serialize)(viewset, obj))
+
+        page = None
+        if viewset.paginator is not None:
+            page = await viewset.paginator.apaginate_queryset(queryset, viewset.request, view=viewset)
+        if page is not None:
+            data = await sync_to_async(self.serialize)(viewset, page, many=True)
+            return viewset.paginator.get_paginated_response(data)
+        objects = [obj async for obj in queryset.aiterator(chunk_size=2000)]
+        return Response(await sync_to_async(self.serialize)(viewset, objects, many=True))
+
+    async def get_object(self, viewset, queryset):
+        lookup_url_kwarg = viewset.lookup_url_kwarg or viewset.lookup_field
+        try:
+            obj = await queryset.aget(**{viewset.lookup_field: viewset.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404
+        viewset.check_object_permissions(viewset.request, obj)
+        return obj
@@ -10,7 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
-from decouple import config
+from decouple import config, Csv
 from pathlib import Path
 import os, json
 
@@ -55,6 +55,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'utils.db.primary_stickiness_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,13 +89,79 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+DB_ENGINE = config('DB_ENGINE', default='django.db.backends.sqlite3')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': DB_ENGINE,
+        'NAME': BASE_DIR / config('DB_NAME', default='db.sqlite3')
+        if DB_ENGINE.endswith('sqlite3') else config('DB_NAME'),
+        'USER': config('DB_USER', default=''),
+        'PASSWORD': config('DB_PASSWORD', default=''),
+        'HOST': config('DB_HOST', default=''),
+        'PORT': config('DB_PORT', default=''),
+        # Persistent connections; use 0 under ASGI, where every request gets a new connection anyway.
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0, cast=int),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=False, cast=bool),
+        # Required behind a transaction-pooling PgBouncer.
+        'DISABLE_SERVER_SIDE_CURSORS': config('DB_DISABLE_SERVER_SIDE_CURSORS', default=False, cast=bool),
+    }
+}
+
+# Opt-in tuning for single-node SQLite deployments. WAL lets reads run next to a write, and BEGIN IMMEDIATE takes
+# the write lock when a transaction starts, so concurrent writers wait up to SQLITE_BUSY_TIMEOUT seconds for it
+# instead of failing with "database is locked" halfway through.
+if DB_ENGINE.endswith('sqlite3') and config('SQLITE_TUNING', default=False, cast=bool):
+    DATABASES['default']['ENGINE'] = 'utils.sqlite'
+    DATABASES['default']['OPTIONS'] = {
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': config('SQLITE_BUSY_TIMEOUT', default=20, cast=int),
+        'init_command': (
+            'PRAGMA journal_mode = WAL; '
+            'PRAGMA synchronous = NORMAL; '
+            f'PRAGMA mmap_size = {config("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024, cast=int)}; '
+            f'PRAGMA cache_size = -{config("SQLITE_CACHE_SIZE_KB", default=64 * 1024, cast=int)}'
+        ),
+    }
+
+# Read replicas as host[:port], with the credentials of the primary. Tests run them as mirrors of `default`.
+for index, replica in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    host, _, port = replica.partition(':')
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['utils.db.PrimaryReplicaRouter']
+
+# Models read from replicas; writes and all other models use the primary. After a write, the client keeps
+# reading from the primary for REPLICA_STICKY_SECONDS.
+REPLICA_READ_MODELS = ['core.Category', 'core.Food', 'core.Size', 'core.FoodMakeup', 'core.FoodWeight']
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='food-cache'),
     }
 }
 
+MENU_CACHE_TIMEOUT = config('MENU_CACHE_TIMEOUT', default=60 * 60, cast=int)
+
+# Order status events for /orders/<id>/events/. LocalBroker only fans out within one process; point this at a
+# broker class with the same publish/subscribe interface when running several workers.
+ORDER_EVENTS_BROKER = config('ORDER_EVENTS_BROKER', default='core.pubsub.LocalBroker')
+ORDER_EVENTS_KEEPALIVE = config('ORDER_EVENTS_KEEPALIVE', default=15, cast=int)
+
+# Serves category and food list/retrieve with async views on the async ORM; meant for ASGI deployments.
+ASYNC_CATALOG_VIEWS = config('ASYNC_CATALOG_VIEWS', default=False, cast=bool)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -139,6 +206,26 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static', 'static_root')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media and static files are served by utils.views.serve when SERVE_FILES is on. SENDFILE_BACKEND hands the
+# transfer off to the front server: '' streams from Django, 'x-sendfile' (Apache, lighttpd) or 'x-accel-redirect'
+# (nginx, with internal locations at the *_ACCEL_REDIRECT_PREFIX paths).
+SERVE_FILES = config('SERVE_FILES', default=DEBUG, cast=bool)
+SENDFILE_BACKEND = config('SENDFILE_BACKEND', default='')
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected/media/')
+STATIC_ACCEL_REDIRECT_PREFIX = config('STATIC_ACCEL_REDIRECT_PREFIX', default='/protected/static/')
+
+# Uploaded images are resized in a local process pool; 0 resizes them in-process right after the commit.
+IMAGE_PROCESSING_WORKERS = config('IMAGE_PROCESSING_WORKERS', default=2, cast=int)
+
+# Widths rendered for responsive `srcset`s by the image processing queue (never wider than the image), stored
+# under MEDIA_ROOT/variants/ by content hash. Run warm_image_variants after changing them.
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'detail': 1024,
+}
+IMAGE_VARIANTS_QUALITY = 80
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -152,7 +239,16 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ],
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 CORS_ORIGIN_ALLOW_ALL = True
@@ -14,12 +14,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.shortcuts import redirect
 
+from utils.views import serve, MEDIA_HASHED_NAME_RE, STATIC_HASHED_NAME_RE
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('core.urls')),
@@ -27,5 +30,12 @@ urlpatterns = [
     path('_nested_admin/', include('nested_admin.urls')),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+if settings.SERVE_FILES:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve,
+                {'document_root': settings.MEDIA_ROOT, 'accel_prefix': settings.MEDIA_ACCEL_REDIRECT_PREFIX,
+                 'hashed_name_re': MEDIA_HASHED_NAME_RE}),
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), serve,
+                {'document_root': settings.STATIC_ROOT, 'accel_prefix': settings.STATIC_ACCEL_REDIRECT_PREFIX,
+                 'hashed_name_re': STATIC_HASHED_NAME_RE}),
+    ]
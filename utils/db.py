@@ -0,0 +1,95 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+from rest_framework.permissions import SAFE_METHODS
+
+_read_primary = ContextVar('read_primary', default=False)
+
+
+def get_replica_aliases():
+    """Aliases of the databases that mirror the primary, see DB_REPLICA_HOSTS."""
+    return [
+        alias for alias, database in settings.DATABASES.items()
+        if database.get('TEST', {}).get('MIRROR') == DEFAULT_DB_ALIAS
+    ]
+
+
+@contextmanager
+def read_from_primary():
+    token = _read_primary.set(True)
+    try:
+        yield
+    finally:
+        _read_primary.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads of REPLICA_READ_MODELS to a random replica and everything else to the
+    primary. Reads stay on the primary inside transactions, for sticky clients and
+    for relations of instances that were loaded from it.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label not in settings.REPLICA_READ_MODELS or _read_primary.get():
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = get_replica_aliases()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+@sync_and_async_middleware
+def primary_stickiness_middleware(get_response):
+    """
+    Reads from the primary during writes and, for REPLICA_STICKY_SECONDS after a
+    successful one, on the same client's next requests, so clients read their own
+    writes despite replication lag.
+    """
+    cookie_name = 'db_primary'
+
+    def set_sticky_cookie(request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and settings.REPLICA_STICKY_SECONDS:
+            response.set_cookie(cookie_name, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True,
+                                samesite='Lax')
+        return response
+
+    def is_sticky(request):
+        return request.method not in SAFE_METHODS or cookie_name in request.COOKIES
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = _read_primary.set(is_sticky(request))
+            try:
+                response = await get_response(request)
+            finally:
+                _read_primary.reset(token)
+            return set_sticky_cookie(request, response)
+    else:
+        def middleware(request):
+            token = _read_primary.set(is_sticky(request))
+            try:
+                response = get_response(request)
+            finally:
+                _read_primary.reset(token)
+            return set_sticky_cookie(request, response)
+
+    return middleware
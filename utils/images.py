@@ -0,0 +1,298 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, models, transaction
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import Signal
+from django.utils import timezone
+
+from PIL import Image, ImageFile, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Sent with pk and field_name once a processed image was written to the row.
+image_processed = Signal()
+
+IMAGE_PENDING = 'pending'
+IMAGE_READY = 'ready'
+IMAGE_FAILED = 'failed'
+
+IMAGE_STATUS = (
+    (IMAGE_PENDING, 'В обработке'),
+    (IMAGE_READY, 'Готово'),
+    (IMAGE_FAILED, 'Ошибка обработки'),
+)
+
+CROP_CENTERING = {
+    'top': 0, 'middle': 0.5, 'bottom': 1,
+    'left': 0, 'center': 0.5, 'right': 1,
+}
+
+
+def resize_image(content, size=None, crop=None, force_format=None, quality=-1):
+    """
+    Resizes and re-encodes image bytes the way django_resized does. Runs in a worker
+    process, so it must not touch Django.
+    """
+    img = ImageOps.exif_transpose(Image.open(BytesIO(content)))
+    img_format = force_format or img.format
+    if img_format.lower() in ('jpeg', 'jpg') and img.mode != 'RGB':
+        img = img.convert('RGB')
+    elif img_format.lower() == 'png' and img.mode != 'RGBA':
+        img = img.convert('RGBA')
+
+    size = size or img.size
+    if crop:
+        img = ImageOps.fit(img, size, Image.Resampling.LANCZOS,
+                           centering=(CROP_CENTERING[crop[1]], CROP_CENTERING[crop[0]]))
+    else:
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+
+    ImageFile.MAXBLOCK = max(ImageFile.MAXBLOCK, img.size[0] * img.size[1])
+    output = BytesIO()
+    img.save(output, format=img_format, quality=quality)
+    return output.getvalue(), _get_extension(img_format)
+
+
+def render_variants(content, widths, quality=-1):
+    """
+    Renders WEBP copies of image bytes at each of `widths`, clamped to the width of
+    the image so nothing is upscaled. Returns {width: bytes}; runs in a worker process.
+    """
+    source_width = Image.open(BytesIO(content)).size[0]
+    return {
+        width: resize_image(content, size=[width, width * 10], force_format='WEBP', quality=quality)[0]
+        for width in sorted({min(width, source_width) for width in widths})
+    }
+
+
+def process_image(content, resize_options, variant_widths=(), variant_quality=-1):
+    """
+    Resizes an upload and renders its variants in one worker job. Without
+    `resize_options` the image is kept as is and the extension returned is None.
+    """
+    extension = None
+    if resize_options is not None:
+        content, extension = resize_image(content, **resize_options)
+    return content, extension, render_variants(content, variant_widths, variant_quality) if variant_widths else {}
+
+
+def _get_extension(img_format):
+    extensions = {value: key for key, value in Image.registered_extensions().items()}
+    extensions['PNG'] = '.png'
+    return extensions.get(img_format.upper(), '')
+
+
+class ImageProcessingQueue:
+    """
+    Local queue that resizes uploaded images in a process pool and writes the result
+    back to the model once it is ready.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESSING_WORKERS)
+            return self._executor
+
+    def submit(self, instance, field_name, resize=True):
+        """
+        Queues resizing of the image, or with `resize` False only rendering its
+        variants, e.g. for images that were processed already. Errors are logged
+        and mark the image failed, since this usually runs after the commit.
+        """
+        model = type(instance)
+        field = instance._meta.get_field(field_name)
+        fieldfile = getattr(instance, field_name)
+        try:
+            with fieldfile.open('rb'):
+                content = fieldfile.read()
+
+            args = (process_image, content, field.resize_options if resize else None) + _get_variant_options(field)
+            if settings.IMAGE_PROCESSING_WORKERS:
+                future = self.executor.submit(*args)
+            else:
+                future = Future()
+                try:
+                    future.set_result(args[0](*args[1:]))
+                except Exception as e:
+                    future.set_exception(e)
+        except Exception as e:
+            logger.exception('Could not queue image %s', fieldfile.name)
+            if isinstance(e, BrokenProcessPool):
+                with self._lock:
+                    self._executor = None
+            model._default_manager.filter(pk=instance.pk, **{field_name: fieldfile.name}).update(
+                **{field.status_field: IMAGE_FAILED}
+            )
+            return None
+        future.add_done_callback(partial(self._finish, model, instance.pk, field_name, fieldfile.name))
+        return future
+
+    def _finish(self, model, pk, field_name, raw_name, future):
+        # Runs on the executor's thread, so the result is written with UPDATEs that send no model signals;
+        # image_processed tells the rest of the project about it.
+        field = model._meta.get_field(field_name)
+        queryset = model._default_manager.filter(pk=pk, **{field_name: raw_name})
+        try:
+            try:
+                content, extension, rendered = future.result()
+            except Exception:
+                logger.exception('Could not process image %s', raw_name)
+                queryset.update(**{field.status_field: IMAGE_FAILED})
+                return
+
+            instance = queryset.first()
+            if instance is None:
+                return
+            if extension is None:
+                name = raw_name
+            else:
+                name = os.path.basename(os.path.splitext(raw_name)[0] + extension)
+                name = field.storage.save(field.generate_filename(instance, name), ContentFile(content),
+                                          max_length=field.max_length)
+            updates = {field_name: name, field.status_field: IMAGE_READY}
+            if field.variants_field:
+                updates[field.variants_field] = store_image_variants(field.storage, content, rendered)
+            if any(f.name == 'updated_at' for f in model._meta.concrete_fields):
+                updates['updated_at'] = timezone.now()
+            if queryset.update(**updates):
+                if name != raw_name:
+                    field.storage.delete(raw_name)
+                image_processed.send(sender=model, pk=pk, field_name=field_name)
+            elif name != raw_name:
+                # Replaced by another upload meanwhile.
+                field.storage.delete(name)
+        finally:
+            if settings.IMAGE_PROCESSING_WORKERS:
+                connections.close_all()
+
+
+image_queue = ImageProcessingQueue()
+
+
+class DeferredResizedImageField(models.ImageField):
+    """
+    ImageField that stores uploads as is and leaves resizing and re-encoding to the
+    image processing queue; `status_field` tracks the progress and the optional
+    `variants_field` (a JSONField) receives the IMAGE_VARIANTS rendered with it.
+    """
+
+    def __init__(self, verbose_name=None, name=None, size=None, crop=None, force_format=None, quality=-1,
+                 status_field=None, variants_field=None, **kwargs):
+        self.resize_options = {'size': size, 'crop': crop, 'force_format': force_format, 'quality': quality}
+        self.status_field = status_field
+        self.variants_field = variants_field
+        super().__init__(verbose_name, name, **kwargs)
+
+    @property
+    def state_fields(self):
+        """Columns that serializing the image reads besides the file name."""
+        return [name for name in (self.status_field, self.variants_field) if name]
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.update(self.resize_options, status_field=self.status_field, variants_field=self.variants_field)
+        return name, path, args, kwargs
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            pre_save.connect(self._pre_save, sender=cls, weak=False)
+            post_save.connect(self._post_save, sender=cls, weak=False)
+
+    def _pre_save(self, sender, instance, raw=False, **kwargs):
+        fieldfile = getattr(instance, self.attname)
+        if not raw and fieldfile and not fieldfile._committed:
+            setattr(instance, self.status_field, IMAGE_PENDING)
+            if self.variants_field:
+                setattr(instance, self.variants_field, {})
+            instance.__dict__.setdefault('_pending_images', set()).add(self.attname)
+
+    def _post_save(self, sender, instance, **kwargs):
+        pending = instance.__dict__.get('_pending_images', set())
+        if self.attname in pending:
+            pending.discard(self.attname)
+            transaction.on_commit(partial(image_queue.submit, instance, self.attname), using=kwargs.get('using'))
+
+
+def _get_variant_options(field):
+    if not getattr(field, 'variants_field', None):
+        return ((), -1)
+    return (tuple(settings.IMAGE_VARIANTS.values()), settings.IMAGE_VARIANTS_QUALITY)
+
+
+def store_image_variants(storage, content, rendered):
+    """
+    Saves variants from render_variants() under `variants/`, keyed by the hash of the
+    image, and returns the {variant: [name, width]} map for the variants field.
+    """
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    names = {}
+    for width, data in rendered.items():
+        name = f'variants/{digest[:2]}/{digest}-{width}w.webp'
+        names[width] = name if storage.exists(name) else storage.save(name, ContentFile(data))
+    if not names:
+        return {}
+    source_width = max(names)
+    return {
+        variant: [names[min(width, source_width)], min(width, source_width)]
+        for variant, width in settings.IMAGE_VARIANTS.items()
+    }
+
+
+def build_image_variants(instance, field_name):
+    """
+    Renders the variants of an already processed image in this process and writes
+    them to the row, for images stored before they had variants. Returns the map or
+    None when the image is missing, not ready or could not be read.
+    """
+    field = instance._meta.get_field(field_name)
+    fieldfile = getattr(instance, field_name)
+    if not fieldfile or not field.variants_field or getattr(instance, field.status_field) != IMAGE_READY:
+        return None
+    try:
+        with fieldfile.open('rb'):
+            content = fieldfile.read()
+        widths, quality = _get_variant_options(field)
+        variants = store_image_variants(fieldfile.storage, content, render_variants(content, widths, quality))
+    except (OSError, ValueError):
+        logger.warning('Could not build variants of %s', fieldfile.name, exc_info=True)
+        return None
+    updated = type(instance)._default_manager.filter(pk=instance.pk, **{field_name: fieldfile.name}).update(
+        **{field.variants_field: variants}
+    )
+    if updated:
+        setattr(instance, field.variants_field, variants)
+        image_processed.send(sender=type(instance), pk=instance.pk, field_name=field_name)
+    return variants
+
+
+def get_image_variants(fieldfile):
+    """
+    Returns {variant: (url, width)} from the variants stored with the image, or None
+    while the image is processing or has none yet. Does no I/O.
+    """
+    if not fieldfile:
+        return None
+    field = fieldfile.field
+    instance = fieldfile.instance
+    if getattr(field, 'status_field', None) and getattr(instance, field.status_field, IMAGE_READY) != IMAGE_READY:
+        return None
+    variants = getattr(instance, field.variants_field, None) if getattr(field, 'variants_field', None) else None
+    if not variants:
+        return None
+    return {variant: (fieldfile.storage.url(name), width) for variant, (name, width) in variants.items()}
@@ -0,0 +1,99 @@
+from django.core.exceptions import FieldDoesNotExist
+
+from rest_framework import serializers
+
+
+def _get_relation(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+def get_related_lookups(serializer, model=None, prefix='', nested_in_prefetch=False):
+    """
+    Walks serializer fields and returns (select_related, prefetch_related) lookups
+    needed to render it without per-row queries.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if model is None:
+        model = serializer.Meta.model
+
+    select_related, prefetch_related = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*' or len(field.source_attrs) != 1:
+            continue
+        relation = _get_relation(model, field.source_attrs[0])
+        if relation is None:
+            continue
+
+        lookup = f'{prefix}{field.source_attrs[0]}'
+        is_many = relation.many_to_many or relation.one_to_many
+        if isinstance(field, serializers.BaseSerializer):
+            in_prefetch = nested_in_prefetch or is_many
+            (prefetch_related if in_prefetch else select_related).append(lookup)
+            nested_select, nested_prefetch = get_related_lookups(
+                field, relation.related_model, f'{lookup}__', in_prefetch
+            )
+            select_related += nested_select
+            prefetch_related += nested_prefetch
+        elif isinstance(field, serializers.ManyRelatedField) or is_many:
+            prefetch_related.append(lookup)
+        elif not isinstance(field, serializers.PrimaryKeyRelatedField):
+            (prefetch_related if nested_in_prefetch else select_related).append(lookup)
+
+    return select_related, prefetch_related
+
+
+def get_only_fields(serializer, model=None, prefix=''):
+    """
+    Returns the columns the serializer reads from the model and its select_related
+    relations, for `.only()`. None when some field reads anything but a model field,
+    except fields listed in `Meta.annotated_fields`.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if model is None:
+        model = serializer.Meta.model
+    annotated_fields = getattr(serializer.Meta, 'annotated_fields', {})
+
+    only = []
+    for name, field in serializer.fields.items():
+        if field.write_only or name in annotated_fields:
+            continue
+        if field.source == '*' or len(field.source_attrs) != 1:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source_attrs[0])
+        except FieldDoesNotExist:
+            return None
+        if model_field.many_to_many or model_field.one_to_many:
+            continue
+        if not model_field.concrete:
+            return None
+
+        lookup = f'{prefix}{model_field.name}'
+        only.append(lookup)
+        only += [f'{prefix}{name}' for name in getattr(model_field, 'state_fields', ())]
+        if isinstance(field, serializers.BaseSerializer):
+            nested = get_only_fields(field, model_field.related_model, f'{lookup}__')
+            if nested is None:
+                return None
+            only += nested
+
+    return only
+
+
+def optimize_queryset(queryset, serializer, only=False):
+    select_related, prefetch_related = get_related_lookups(serializer, queryset.model)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    if only:
+        only_fields = get_only_fields(serializer, queryset.model)
+        if only_fields:
+            queryset = queryset.only(*only_fields)
+    return queryset
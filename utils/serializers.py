@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+
+from rest_framework import serializers
+
+from utils.images import get_image_variants
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Read-only map of resized variants of an image field plus a ready to use `srcset`.
+    Until the variants are rendered every variant points to the image itself.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get('request', None)
+        build_url = request.build_absolute_uri if request is not None else str
+
+        variants = get_image_variants(value)
+        if not variants:
+            url = build_url(value.url)
+            ret = {variant: url for variant in settings.IMAGE_VARIANTS}
+            ret['srcset'] = url
+            return ret
+
+        urls = {variant: (build_url(url), width) for variant, (url, width) in variants.items()}
+        ret = {variant: url for variant, (url, _) in urls.items()}
+        ret['srcset'] = ', '.join(f'{url} {width}w' for url, width in sorted({
+            (url, width) for url, width in urls.values()
+        }, key=lambda item: item[1]))
+        return ret
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that list serializers can `prefetch` for all items at
+    once, so a list of payloads is resolved with one query instead of one per item.
+    """
+
+    def _to_pk(self, value):
+        # '1' and 1 are the same object; anything that is not a pk is left to to_internal_value().
+        if not isinstance(value, (int, str)) or isinstance(value, bool):
+            return None
+        try:
+            return self.get_queryset().model._meta.pk.to_python(value)
+        except DjangoValidationError:
+            return None
+
+    def prefetch(self, values):
+        pks = {self._to_pk(value) for value in values} - {None}
+        self.prefetched = self.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        pk = self._to_pk(data)
+        prefetched = getattr(self, 'prefetched', {})
+        if pk is not None and pk in prefetched:
+            return prefetched[pk]
+        return super().to_internal_value(data)
+
+
+def parse_field_paths(value):
+    """
+    Turns 'id,category.name' into {'id': {}, 'category': {'name': {}}}.
+    """
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in filter(None, (part.strip() for part in path.split('.'))):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _collapse_to_pk(name, field):
+    kwargs = {'read_only': True}
+    if field.source != name:
+        kwargs['source'] = field.source
+    if isinstance(field, serializers.ListSerializer):
+        kwargs['many'] = True
+    return serializers.PrimaryKeyRelatedField(**kwargs)
+
+
+def prune_serializer(serializer, fields=None, expand=None, prefix=''):
+    """
+    Drops fields of the serializer that are not in the `fields` tree and replaces
+    nested serializers that are not in the `expand` tree with primary keys. None
+    leaves that level as is; both trees come from `parse_field_paths`. Unknown
+    names in `fields` raise a ValidationError.
+    """
+    target = serializer.child if isinstance(serializer, serializers.ListSerializer) else serializer
+    unknown = sorted(set(fields or ()) - set(target.fields))
+    if unknown:
+        raise serializers.ValidationError({'fields': [f'unknown field {prefix}{name}' for name in unknown]})
+    for name, field in list(target.fields.items()):
+        if fields is not None and name not in fields:
+            del target.fields[name]
+            continue
+        if not isinstance(field, serializers.BaseSerializer):
+            continue
+        if expand is not None and name not in expand:
+            target.fields[name] = _collapse_to_pk(name, field)
+        else:
+            prune_serializer(field, fields.get(name) or None if fields else None,
+                             expand.get(name) if expand is not None else None, f'{prefix}{name}.')
+    return serializer
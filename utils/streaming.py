@@ -0,0 +1,28 @@
+import csv
+import io
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def ndjson_lines(rows, renderer):
+    for row in rows:
+        yield renderer.render(row) + b'\n'
+
+
+def csv_lines(rows, fieldnames):
+    """
+    Yields CSV lines one row at a time; nested values are written as JSON.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({
+            key: json.dumps(value, cls=JSONEncoder, ensure_ascii=False) if isinstance(value, (list, dict)) else value
+            for key, value in row.items()
+        })
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,160 @@
+from types import SimpleNamespace
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from rest_framework import serializers
+
+
+class RelatedRows:
+    """
+    Rows of a reverse relation fetched with one `.values()` query for all parents
+    and grouped by parent pk; `plan` None fetches primary keys only.
+    """
+
+    def __init__(self, model, fk_attname, parent_column, plan=None):
+        self.model = model
+        self.fk_attname = fk_attname
+        self.parent_column = parent_column
+        self.plan = plan
+
+    def fetch(self, parent_ids):
+        grouped = {}
+        if not parent_ids:
+            return grouped
+
+        queryset = self.model._default_manager.filter(**{f'{self.fk_attname}__in': parent_ids})
+        if self.plan is None:
+            for parent_id, pk in queryset.values_list(self.fk_attname, 'pk'):
+                grouped.setdefault(parent_id, []).append(pk)
+            return grouped
+
+        columns = [self.fk_attname] + [column for column in self.plan.columns if column != self.fk_attname]
+        rows = list(queryset.values(*columns))
+        for row, data in zip(rows, self.plan.render(rows)):
+            grouped.setdefault(row[self.fk_attname], []).append(data)
+        return grouped
+
+
+class ValuesPlan:
+    """
+    Precomputed accessors that render `.values()` rows into the same data the
+    serializer would produce from model instances.
+    """
+
+    def __init__(self, pk_column):
+        self.pk_column = pk_column
+        self.columns = [pk_column]
+        self.fields = []
+        self.related = []
+
+    def add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+
+    def render(self, rows):
+        rows = list(rows)
+        related = {
+            step: step.fetch({row[step.parent_column] for row in rows} - {None})
+            for step in self.related
+        }
+        return [self.build(row, related) for row in rows]
+
+    def build(self, row, related):
+        ret = {}
+        for name, kind, column, arg in self.fields:
+            value = row[column]
+            if kind == 'related':
+                ret[name] = related[arg].get(value, [])
+            elif kind == 'nested':
+                ret[name] = None if value is None else arg.build(row, related)
+            elif kind == 'file':
+                field, model_field, state_columns = arg
+                instance = SimpleNamespace(**{name: row[column] for name, column in state_columns.items()})
+                ret[name] = field.to_representation(model_field.attr_class(instance, model_field, value))
+            elif value is None:
+                ret[name] = None
+            else:
+                ret[name] = arg(value)
+        return ret
+
+
+def _get_converter(field, model_field):
+    if model_field is None or type(model_field.model.__dict__.get(model_field.attname)) is DeferredAttribute:
+        return field.to_representation
+    # Fields with their own descriptor (e.g. phone numbers) hand serializers a converted value.
+    return lambda value: field.to_representation(model_field.to_python(value))
+
+
+def compile_values_plan(serializer, model=None, prefix=''):
+    """
+    Compiles a ValuesPlan from a (possibly pruned) serializer. Returns None when the
+    serializer uses anything the plan can not reproduce exactly, like custom
+    `to_representation`, method fields or hyperlinks.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if type(serializer).to_representation is not serializers.Serializer.to_representation:
+        return None
+    if model is None:
+        model = serializer.Meta.model
+    annotated_fields = getattr(serializer.Meta, 'annotated_fields', {})
+
+    plan = ValuesPlan(f'{prefix}{model._meta.pk.attname}')
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in annotated_fields:
+            if prefix:
+                return None
+            plan.add_column(annotated_fields[name])
+            plan.fields.append((name, 'value', annotated_fields[name], _get_converter(field, None)))
+            continue
+        if field.source == '*' or len(field.source_attrs) != 1:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source_attrs[0])
+        except FieldDoesNotExist:
+            return None
+
+        if model_field.one_to_many and isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField)):
+            if isinstance(field, serializers.ManyRelatedField):
+                child_relation = field.child_relation
+                if type(child_relation) is not serializers.PrimaryKeyRelatedField or child_relation.pk_field:
+                    return None
+                child_plan = None
+            else:
+                child_plan = compile_values_plan(field.child, model_field.related_model)
+                if child_plan is None:
+                    return None
+            step = RelatedRows(model_field.related_model, model_field.field.attname, plan.pk_column, child_plan)
+            plan.related.append(step)
+            plan.fields.append((name, 'related', plan.pk_column, step))
+        elif model_field.many_to_one and isinstance(field, serializers.BaseSerializer):
+            nested = compile_values_plan(field, model_field.related_model, f'{prefix}{model_field.name}__')
+            if nested is None:
+                return None
+            for column in nested.columns:
+                plan.add_column(column)
+            plan.related += nested.related
+            plan.fields.append((name, 'nested', nested.pk_column, nested))
+        elif model_field.many_to_one and type(field) is serializers.PrimaryKeyRelatedField and not field.pk_field:
+            column = f'{prefix}{model_field.attname}'
+            plan.add_column(column)
+            plan.fields.append((name, 'value', column, lambda value: value))
+        elif model_field.is_relation or not model_field.concrete:
+            return None
+        elif isinstance(model_field, models.FileField):
+            column = f'{prefix}{model_field.attname}'
+            state_columns = {state: f'{prefix}{state}' for state in getattr(model_field, 'state_fields', ())}
+            for state_column in state_columns.values():
+                plan.add_column(state_column)
+            plan.add_column(column)
+            plan.fields.append((name, 'file', column, (field, model_field, state_columns)))
+        else:
+            column = f'{prefix}{model_field.attname}'
+            plan.add_column(column)
+            plan.fields.append((name, 'value', column, _get_converter(field, model_field)))
+
+    return plan
@@ -0,0 +1,123 @@
+import mimetypes
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# Names that only ever hold one content: ManifestStaticFilesStorage's `name.<md5[:12]>.ext` and the image
+# variants stored by utils.images.store_image_variants().
+STATIC_HASHED_NAME_RE = re.compile(r'(?:^|/)[^/]+\.[0-9a-f]{12}\.[^./]+$')
+MEDIA_HASHED_NAME_RE = re.compile(r'^variants/[0-9a-f]{2}/[0-9a-f]{32}-\d+w\.webp$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+
+
+class RangeFile:
+    """
+    File object that stops reading after `length` bytes, for bounded range responses.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Returns (start, end) of a single `bytes=` range, None to serve the whole file
+    and raises ValueError for unsatisfiable ranges.
+    """
+    match = RANGE_RE.match(header or '')
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError('Unsatisfiable range')
+    return start, end
+
+
+def serve(request, path, document_root, accel_prefix=None, hashed_name_re=None):
+    """
+    Serves a file below `document_root` with range support and long-lived caching of
+    paths matching `hashed_name_re`, the content-hashed names of its storage. Depending
+    on SENDFILE_BACKEND the transfer is handed off to the front server via X-Sendfile or
+    X-Accel-Redirect; otherwise the file is streamed with FileResponse, which WSGI
+    servers turn into a zero-copy sendfile.
+    """
+    try:
+        fullpath = Path(safe_join(document_root, path))
+    except SuspiciousFileOperation:
+        raise Http404
+    if not fullpath.is_file():
+        raise Http404
+
+    stat = fullpath.stat()
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, encoding = mimetypes.guess_type(str(fullpath))
+    content_type = content_type or 'application/octet-stream'
+    last_modified = http_date(stat.st_mtime)
+
+    backend = settings.SENDFILE_BACKEND
+    if backend == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = str(fullpath)
+    elif backend == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(f'{accel_prefix.rstrip("/")}/{path}')
+    else:
+        range_header = request.META.get('HTTP_RANGE')
+        if request.META.get('HTTP_IF_RANGE', last_modified) != last_modified:
+            range_header = None
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+        file = fullpath.open('rb')
+        if byte_range is None:
+            response = FileResponse(file, content_type=content_type)
+        else:
+            start, end = byte_range
+            file.seek(start)
+            if end < stat.st_size - 1:
+                file = RangeFile(file, end - start + 1)
+            response = FileResponse(file, status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(end - start + 1)
+        response['Accept-Ranges'] = 'bytes'
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Last-Modified'] = last_modified
+    hashed = hashed_name_re is not None and hashed_name_re.search(path) is not None
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if hashed else DEFAULT_CACHE_CONTROL
+    return response